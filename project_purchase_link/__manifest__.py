@@ -3,12 +3,19 @@
 
 {
     "name": "Project Purchase Link",
-    "version": "17.0.1.0.0",
+    "version": "17.0.1.3.0",
     "license": "AGPL-3",
     "depends": ["project", "purchase", "hr_timesheet"],
     "author": "AvanzOSC, " "Odoo Community Association (OCA)",
     "website": "https://github.com/OCA/project",
     "category": "Project",
-    "data": ["views/project_project_view.xml"],
+    "data": [
+        "security/ir.model.access.csv",
+        "data/ir_cron.xml",
+        "views/project_project_view.xml",
+        "views/purchase_account_search_view.xml",
+        "views/res_config_settings_view.xml",
+    ],
     "installable": True,
+    "post_init_hook": "post_init_hook",
 }
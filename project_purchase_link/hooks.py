@@ -0,0 +1,6 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+
+def post_init_hook(env):
+    """Build the purchase summaries of the existing purchases and bills."""
+    env["project.purchase.summary"]._cron_rebuild()
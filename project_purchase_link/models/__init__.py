@@ -1,4 +1,10 @@
 # Copyright 2019 Oihane Crucelaegui - AvanzOSC
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
 
+from . import account_move
+from . import account_move_line
 from . import project_project
+from . import project_purchase_summary
+from . import purchase_order
+from . import purchase_order_line
+from . import res_config_settings
@@ -0,0 +1,45 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import fields, models
+
+
+class AccountMove(models.Model):
+    _inherit = "account.move"
+
+    # Technical field: only searchable, to filter the records of a project
+    analytic_project_id = fields.Many2one(
+        comodel_name="project.project",
+        string="Project",
+        store=False,
+        search="_search_analytic_project_id",
+    )
+
+    # Fields whose change may alter the totals of the analytic accounts: only
+    # non-cancelled vendor bills count, and the balance of their lines follows
+    # the currency and the dates of the bill
+    _project_purchase_summary_fields = (
+        "currency_id",
+        "date",
+        "invoice_date",
+        "move_type",
+        "state",
+    )
+
+    def _search_analytic_project_id(self, operator, value):
+        account_ids = self.env["project.project"]._get_search_analytic_account_ids(
+            operator, value
+        )
+        return [("line_ids.analytic_distribution_search", "in", account_ids)]
+
+    def write(self, vals):
+        result = super().write(vals)
+        if set(self._project_purchase_summary_fields).intersection(vals):
+            self.env["project.purchase.summary"]._queue_lines(self.line_ids)
+        return result
+
+    def unlink(self):
+        summary_model = self.env["project.purchase.summary"]
+        account_ids = summary_model._get_distribution_account_ids(self.line_ids)
+        result = super().unlink()
+        summary_model._queue_accounts(account_ids)
+        return result
@@ -0,0 +1,57 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import api, fields, models
+
+
+class AccountMoveLine(models.Model):
+    _inherit = "account.move.line"
+
+    # Technical field: only searchable, to filter the records of a project
+    analytic_project_id = fields.Many2one(
+        comodel_name="project.project",
+        string="Project",
+        store=False,
+        search="_search_analytic_project_id",
+    )
+
+    # Fields whose change may alter the totals of the analytic accounts
+    _project_purchase_summary_fields = (
+        "amount_currency",
+        "analytic_distribution",
+        "balance",
+        "credit",
+        "debit",
+        "discount",
+        "move_id",
+        "price_unit",
+        "quantity",
+        "tax_ids",
+    )
+
+    def _search_analytic_project_id(self, operator, value):
+        account_ids = self.env["project.project"]._get_search_analytic_account_ids(
+            operator, value
+        )
+        return [("analytic_distribution_search", "in", account_ids)]
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        lines = super().create(vals_list)
+        self.env["project.purchase.summary"]._queue_lines(lines)
+        return lines
+
+    def write(self, vals):
+        if not set(self._project_purchase_summary_fields).intersection(vals):
+            return super().write(vals)
+        summary_model = self.env["project.purchase.summary"]
+        account_ids = summary_model._get_distribution_account_ids(self)
+        result = super().write(vals)
+        summary_model._queue_lines(self, account_ids)
+        return result
+
+    def unlink(self):
+        summary_model = self.env["project.purchase.summary"]
+        account_ids = summary_model._get_distribution_account_ids(self)
+        result = super().unlink()
+        summary_model._queue_accounts(account_ids)
+        return result
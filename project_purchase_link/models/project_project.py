@@ -1,7 +1,8 @@
 # Copyright 2019 Oihane Crucelaegui - AvanzOSC
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
 
-from odoo import _, fields, models
+from odoo import _, api, fields, models
+from odoo.exceptions import UserError
 from odoo.osv import expression
 from odoo.tools.safe_eval import safe_eval
 
@@ -10,140 +11,123 @@ class ProjectProject(models.Model):
     _inherit = "project.project"
 
     purchase_count = fields.Integer(
-        compute="_compute_purchase_info", string="# Purchase"
+        compute="_compute_purchase_info",
+        store=True,
+        string="# Purchase",
     )
-    purchase_line_total = fields.Integer(
-        compute="_compute_purchase_info", string="Purchase Total"
+    purchase_line_total = fields.Monetary(
+        compute="_compute_purchase_info",
+        store=True,
+        string="Purchase Total",
     )
     purchase_invoice_count = fields.Integer(
-        compute="_compute_purchase_invoice_info", string="# Purchase Invoice"
+        compute="_compute_purchase_invoice_info",
+        store=True,
+        string="# Purchase Invoice",
     )
-    purchase_invoice_line_total = fields.Float(
-        compute="_compute_purchase_invoice_info", string="Purchase Invoice Total"
+    purchase_invoice_line_total = fields.Monetary(
+        compute="_compute_purchase_invoice_info",
+        store=True,
+        string="Purchase Invoice Total",
     )
 
+    # The domains below are resolved by analytic.mixin as SQL subqueries when
+    # searching, so their size does not depend on the number of matching lines.
     def _domain_purchase_order(self):
-        query = self.env["purchase.order.line"]._search(
-            [
-                ("order_id.state", "!=", "cancel"),
-            ]
-        )
-        # check if analytic_distribution contains id of analytic account
-        query.add_where(
-            "purchase_order_line.analytic_distribution ?| array[%s]",
-            [str(project.analytic_account_id.id) for project in self],
-        )
-
-        query.order = None
-        query_string, query_param = query.select(
-            "purchase_order_line.order_id as order_id",
-        )
-        self._cr.execute(query_string, query_param)
-        purchase_lines_ids = [
-            int(record.get("order_id")) for record in self._cr.dictfetchall()
+        return [
+            ("state", "!=", "cancel"),
+            (
+                "order_line.analytic_distribution_search",
+                "in",
+                self.analytic_account_id.ids,
+            ),
         ]
-        domain = [("id", "in", purchase_lines_ids)]
-        return domain
 
     def _domain_purchase_order_line(self):
-        query = self.env["purchase.order.line"]._search(
-            [
-                ("order_id.state", "!=", "cancel"),
-            ]
-        )
-        # check if analytic_distribution contains id of analytic account
-        query.add_where(
-            "purchase_order_line.analytic_distribution ?| array[%s]",
-            [str(project.analytic_account_id.id) for project in self],
-        )
-
-        query.order = None
-        query_string, query_param = query.select(
-            "purchase_order_line.id as id",
-        )
-        self._cr.execute(query_string, query_param)
-        purchase_lines_ids = [
-            int(record.get("id")) for record in self._cr.dictfetchall()
+        return [
+            ("order_id.state", "!=", "cancel"),
+            ("analytic_distribution_search", "in", self.analytic_account_id.ids),
         ]
-        domain = [("id", "in", purchase_lines_ids)]
-        return domain
 
     def _domain_purchase_invoice(self):
-        query = self.env["account.move.line"]._search(
-            [
-                ("move_id.state", "!=", "cancel"),
-            ]
-        )
-        # check if analytic_distribution contains id of analytic account
-        query.add_where(
-            "account_move_line.analytic_distribution ?| array[%s]",
-            [str(project.analytic_account_id.id) for project in self],
-        )
-        query.order = None
-        query_string, query_param = query.select(
-            "DISTINCT(account_move_line.move_id) as move_id",
-        )
-        self._cr.execute(query_string, query_param)
-        purchase_invoice_ids = [
-            int(record.get("move_id")) for record in self._cr.dictfetchall()
+        return [
+            ("state", "!=", "cancel"),
+            (
+                "line_ids.analytic_distribution_search",
+                "in",
+                self.analytic_account_id.ids,
+            ),
         ]
-        domain = [("id", "in", purchase_invoice_ids)]
-        return domain
 
     def _domain_purchase_invoice_line(self):
-        query = self.env["account.move.line"]._search(
-            [
-                ("move_id.state", "!=", "cancel"),
-                ("move_id.move_type", "=", "in_invoice"),
-            ]
-        )
-        # check if analytic_distribution contains id of analytic account
-        query.add_where(
-            "account_move_line.analytic_distribution ?| array[%s]",
-            [str(project.analytic_account_id.id) for project in self],
-        )
-        query.order = None
-        query_string, query_param = query.select(
-            "account_move_line.id as id",
-        )
-        self._cr.execute(query_string, query_param)
-        purchase_invoice_lines_ids = [
-            int(record.get("id")) for record in self._cr.dictfetchall()
+        return [
+            ("move_id.state", "!=", "cancel"),
+            ("move_id.move_type", "=", "in_invoice"),
+            ("analytic_distribution_search", "in", self.analytic_account_id.ids),
         ]
-        domain = [("id", "in", purchase_invoice_lines_ids)]
-        return domain
 
+    def _get_purchase_summaries(self):
+        """Map the analytic accounts of the projects to their purchase summary."""
+        self.env["project.purchase.summary"]._process_refresh_queue()
+        summaries = (
+            self.env["project.purchase.summary"]
+            .sudo()
+            .search_fetch(
+                [("account_id", "in", self.analytic_account_id.ids)],
+                [
+                    "account_id",
+                    "purchase_count",
+                    "purchase_line_total",
+                    "purchase_invoice_count",
+                    "purchase_invoice_line_total",
+                ],
+            )
+        )
+        return {summary.account_id.id: summary for summary in summaries}
+
+    @api.depends("analytic_account_id")
     def _compute_purchase_info(self):
+        summaries = self._get_purchase_summaries()
+        empty_summary = self.env["project.purchase.summary"]
         for project in self:
-            groups = self.env["purchase.order.line"].read_group(
-                project._domain_purchase_order_line(),
-                ["price_subtotal"],
-                ["order_id"],
-            )
-            purchase_line_total = 0
-            for group in groups:
-                purchase_line_total += group["price_subtotal"]
-            project.purchase_count = len(groups)
-            project.purchase_line_total = purchase_line_total
+            summary = summaries.get(project.analytic_account_id.id, empty_summary)
+            project.purchase_count = summary.purchase_count
+            project.purchase_line_total = summary.purchase_line_total
 
+    @api.depends("analytic_account_id")
     def _compute_purchase_invoice_info(self):
+        summaries = self._get_purchase_summaries()
+        empty_summary = self.env["project.purchase.summary"]
         for project in self:
-            groups = self.env["account.move.line"].read_group(
-                project._domain_purchase_invoice_line(),
-                ["price_subtotal"],
-                ["move_id"],
-            )
-            purchase_invoice_line_total = 0
-            for group in groups:
-                purchase_invoice_line_total += group["price_subtotal"]
-            project.purchase_invoice_count = len(groups)
-            project.purchase_invoice_line_total = purchase_invoice_line_total
-
+            summary = summaries.get(project.analytic_account_id.id, empty_summary)
+            project.purchase_invoice_count = summary.purchase_invoice_count
+            project.purchase_invoice_line_total = summary.purchase_invoice_line_total
+
+    @api.model
+    def _get_search_analytic_account_ids(self, operator, value):
+        """Return the analytic accounts of the projects matching ``value``.
+
+        Used by the search methods of the ``analytic_project_id`` fields of the
+        purchase and invoice models, with either project ids or a project name.
+        """
+        if operator not in ("=", "in", "ilike"):
+            raise UserError(_("Operation not supported"))
+        if isinstance(value, str):
+            domain = [("name", operator, value)]
+        else:
+            project_ids = value if isinstance(value, (list, tuple)) else [value]
+            domain = [("id", "in", project_ids)]
+        projects = self.with_context(active_test=False).search(domain)
+        return projects.analytic_account_id.ids
+
+    # The actions below filter their records with a search facet on the project,
+    # so the list view resolves them with its own paginated search.
     def button_open_purchase_order(self):
         self.ensure_one()
         return {
             "name": _("Purchase Order"),
-            "domain": self._domain_purchase_order(),
+            "domain": [("state", "!=", "cancel")],
+            "context": {"search_default_analytic_project_id": self.id},
             "type": "ir.actions.act_window",
             "view_mode": "tree,form",
             "res_model": "purchase.order",
@@ -153,7 +137,8 @@ class ProjectProject(models.Model):
         self.ensure_one()
         return {
             "name": _("Purchase Order Lines"),
-            "domain": self._domain_purchase_order_line(),
+            "domain": [("order_id.state", "!=", "cancel")],
+            "context": {"search_default_analytic_project_id": self.id},
             "type": "ir.actions.act_window",
             "view_mode": "tree,form",
             "res_model": "purchase.order.line",
@@ -161,19 +146,27 @@ class ProjectProject(models.Model):
 
     def button_open_purchase_invoice(self):
         self.ensure_one()
-        action = self.env.ref("account.action_move_in_invoice_type")
-        action_dict = action.sudo().read()[0] if action else {}
-        domain = expression.AND(
-            [safe_eval(action.domain or "[]"), self._domain_purchase_invoice()]
+        action = self.env["ir.actions.actions"]._for_xml_id(
+            "account.action_move_in_invoice_type"
+        )
+        action["domain"] = expression.AND(
+            [safe_eval(action.get("domain") or "[]"), [("state", "!=", "cancel")]]
         )
-        action_dict.update({"domain": domain})
-        return action_dict
+        action["context"] = dict(
+            safe_eval(action.get("context") or "{}"),
+            search_default_analytic_project_id=self.id,
+        )
+        return action
 
     def button_open_purchase_invoice_line(self):
         self.ensure_one()
         return {
             "name": _("Purchase Invoice Lines"),
-            "domain": self._domain_purchase_invoice_line(),
+            "domain": [
+                ("move_id.state", "!=", "cancel"),
+                ("move_id.move_type", "=", "in_invoice"),
+            ],
+            "context": {"search_default_analytic_project_id": self.id},
             "type": "ir.actions.act_window",
             "view_mode": "tree,form",
             "res_model": "account.move.line",
@@ -0,0 +1,349 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import api, fields, models
+from odoo.tools.misc import split_every, str2bool
+
+# Key of the refresh queue in the precommit data of the cursor
+REFRESH_QUEUE = "project_purchase_link.summary_refresh_queue"
+
+
+class ProjectPurchaseSummary(models.Model):
+    _name = "project.purchase.summary"
+    _description = "Purchase and invoice totals per analytic account"
+    _rec_name = "account_id"
+    _sql_constraints = [
+        (
+            "account_uniq",
+            "UNIQUE(account_id)",
+            "There can only be one purchase summary per analytic account",
+        ),
+    ]
+
+    account_id = fields.Many2one(
+        comodel_name="account.analytic.account",
+        string="Analytic Account",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    currency_id = fields.Many2one(related="account_id.currency_id")
+    purchase_count = fields.Integer(string="# Purchase", readonly=True)
+    purchase_line_total = fields.Monetary(string="Purchase Total", readonly=True)
+    purchase_invoice_count = fields.Integer(string="# Purchase Invoice", readonly=True)
+    purchase_invoice_line_total = fields.Monetary(
+        string="Purchase Invoice Total", readonly=True
+    )
+
+    @api.model
+    def _is_weighted(self):
+        """Return whether the totals honor the analytic distribution percentages."""
+        return str2bool(
+            self.env["ir.config_parameter"]
+            .sudo()
+            .get_param("project_purchase_link.weighted_distribution", "False")
+        )
+
+    @api.model
+    def _get_line_amounts_query(
+        self,
+        account_ids,
+        model_name,
+        domain,
+        group_field,
+        amount_field,
+        rate_date=None,
+        weighted=False,
+    ):
+        """Return the query listing the amounts of ``model_name`` lines per account.
+
+        The keys of ``analytic_distribution`` are expanded in SQL, including the
+        comma-joined keys of distributions over several analytic plans, so any
+        number of analytic accounts is served by a single query.
+
+        :param amount_field: column holding the amount of the lines.
+        :param rate_date: SQL expression giving the date at which the amounts are
+            converted from the currency of the lines to the currency of their
+            company, or None if the amounts are already in company currency.
+        :param weighted: if True, only the percentage of the amount distributed
+            to each analytic account is returned for it.
+        :return: ``(query_string, query_params)`` of a query with one row per line
+            and analytic account, with the columns ``account_key`` (the analytic
+            account id, as text), ``line_id``, ``group_id`` (the ``group_field``
+            value) and ``amount`` (in company currency).
+        """
+        account_keys = [str(account_id) for account_id in account_ids]
+        table = self.env[model_name]._table
+        line_columns = {
+            "line_id": f"{table}.id",
+            "group_id": f"{table}.{group_field}",
+            "amount": f"{table}.{amount_field}",
+        }
+        if rate_date:
+            line_columns.update(
+                currency_id=f"{table}.currency_id",
+                company_id=f"{table}.company_id",
+                rate_date=rate_date,
+            )
+        columns = [
+            *(f"{expression} as {name}" for name, expression in line_columns.items()),
+            f"{table}.analytic_distribution as distribution",
+            f"jsonb_object_keys({table}.analytic_distribution) as distribution_key",
+        ]
+        line_fields = ", ".join(f"line.{name}" for name in line_columns)
+        amount = "line.amount"
+        if weighted:
+            amount += " * line.percentage / 100"
+        rate_joins = ""
+        if rate_date:
+            # Same rate lookup as res.currency._get_rates(), done for all the
+            # lines at once and skipped for lines in company currency
+            amount += " * COALESCE(to_rate.rate, 1) / COALESCE(from_rate.rate, 1)"
+            rate_joins = """
+                LEFT JOIN res_company AS company ON company.id = line.company_id
+                LEFT JOIN LATERAL (
+                    SELECT rate FROM res_currency_rate
+                    WHERE line.currency_id != company.currency_id
+                        AND currency_id = line.currency_id
+                        AND name <= line.rate_date
+                        AND (company_id IS NULL OR company_id = line.company_id)
+                    ORDER BY company_id, name DESC
+                    LIMIT 1
+                ) AS from_rate ON TRUE
+                LEFT JOIN LATERAL (
+                    SELECT rate FROM res_currency_rate
+                    WHERE line.currency_id != company.currency_id
+                        AND currency_id = company.currency_id
+                        AND name <= line.rate_date
+                        AND (company_id IS NULL OR company_id = line.company_id)
+                    ORDER BY company_id, name DESC
+                    LIMIT 1
+                ) AS to_rate ON TRUE
+            """
+        self.env[model_name].flush_model(
+            ["analytic_distribution", group_field, amount_field]
+            + (["currency_id", "company_id"] if rate_date else [])
+        )
+        # Same lines as the drill-downs of the projects
+        query = self.env[model_name]._search(
+            domain + [("analytic_distribution_search", "in", list(account_ids))]
+        )
+        query.order = None
+        query_string, query_param = query.select(*columns)
+        # An account may be in several keys of a line, such as "3" and "3,7":
+        # the line is listed once for it, with the sum of their percentages
+        return (
+            f"""
+            SELECT line.account_key, line.line_id, line.group_id, {amount} AS amount
+            FROM (
+                SELECT account_key, {line_fields},
+                    SUM((line.distribution ->> line.distribution_key)::numeric)
+                        AS percentage
+                FROM ({query_string}) AS line
+                CROSS JOIN LATERAL
+                    regexp_split_to_table(line.distribution_key, ',') AS account_key
+                WHERE account_key = ANY(%s)
+                GROUP BY account_key, {line_fields}
+            ) AS line
+            {rate_joins}
+            """,
+            [*query_param, account_keys],
+        )
+
+    @api.model
+    def _get_purchase_line_amounts_query(self, account_ids, weighted=False):
+        """Return the amounts query of the purchase order lines, see
+        :meth:`_get_line_amounts_query`."""
+        self.env["purchase.order"].flush_model(["date_order"])
+        return self._get_line_amounts_query(
+            account_ids,
+            "purchase.order.line",
+            [("order_id.state", "!=", "cancel")],
+            "order_id",
+            "price_subtotal",
+            rate_date="""(
+                SELECT date_order::date FROM purchase_order
+                WHERE purchase_order.id = purchase_order_line.order_id
+            )""",
+            weighted=weighted,
+        )
+
+    @api.model
+    def _get_invoice_line_amounts_query(self, account_ids, weighted=False):
+        """Return the amounts query of the vendor bill lines, see
+        :meth:`_get_line_amounts_query`."""
+        # Journal items already hold their balance in company currency
+        return self._get_line_amounts_query(
+            account_ids,
+            "account.move.line",
+            [
+                ("move_id.state", "!=", "cancel"),
+                ("move_id.move_type", "=", "in_invoice"),
+            ],
+            "move_id",
+            "balance",
+            weighted=weighted,
+        )
+
+    @api.model
+    def _read_line_totals(self, line_query):
+        """Aggregate the result of an amounts query per analytic account.
+
+        :return: dict mapping analytic account ids to ``(count, total)``, where
+            ``count`` is the number of distinct groups and ``total`` the sum of
+            the amounts, in company currency.
+        """
+        query_string, query_param = line_query
+        self._cr.execute(
+            f"""
+            SELECT line.account_key::integer,
+                COUNT(DISTINCT line.group_id),
+                SUM(line.amount)
+            FROM ({query_string}) AS line
+            GROUP BY line.account_key
+            """,
+            query_param,
+        )
+        return {
+            account_id: (count, total or 0)
+            for account_id, count, total in self._cr.fetchall()
+        }
+
+    @api.model
+    def _prepare_summary_values(self, account_ids):
+        """Return the up-to-date summary values of the given analytic accounts."""
+        weighted = self._is_weighted()
+        purchase_totals = self._read_line_totals(
+            self._get_purchase_line_amounts_query(account_ids, weighted=weighted)
+        )
+        invoice_totals = self._read_line_totals(
+            self._get_invoice_line_amounts_query(account_ids, weighted=weighted)
+        )
+        values = {}
+        for account_id in account_ids:
+            purchase_count, purchase_line_total = purchase_totals.get(
+                account_id, (0, 0)
+            )
+            invoice_count, invoice_line_total = invoice_totals.get(account_id, (0, 0))
+            values[account_id] = {
+                "purchase_count": purchase_count,
+                "purchase_line_total": purchase_line_total,
+                "purchase_invoice_count": invoice_count,
+                "purchase_invoice_line_total": invoice_line_total,
+            }
+        return values
+
+    @api.model
+    def _refresh_accounts(self, account_ids):
+        """Bring the summaries of the given analytic accounts up to date.
+
+        Only accounts with purchases or purchase invoices get a summary row;
+        rows of accounts that no longer have any are reset to zero.
+        """
+        summary_model = self.sudo()
+        accounts = summary_model.env["account.analytic.account"].browse(account_ids)
+        accounts = accounts.exists()
+        if not accounts:
+            return
+        values = summary_model._prepare_summary_values(accounts.ids)
+        for summary in summary_model.search([("account_id", "in", accounts.ids)]):
+            summary.write(values.pop(summary.account_id.id))
+        summary_model.create(
+            [
+                dict(account_values, account_id=account_id)
+                for account_id, account_values in values.items()
+                if any(account_values.values())
+            ]
+        )
+
+    @api.model
+    def _get_distribution_account_ids(self, lines):
+        """Return the ids of the analytic accounts used by ``lines``."""
+        return {
+            int(account_id)
+            for distribution in lines.mapped("analytic_distribution")
+            for account_key in distribution or {}
+            # Distributions over several plans have keys such as "3,7"
+            for account_id in account_key.split(",")
+        }
+
+    @api.model
+    def _queue_accounts(self, account_ids):
+        """Queue a summary refresh of the given analytic accounts.
+
+        Refreshes are batched: the queue is processed when the purchase fields
+        of the related projects are recomputed, usually on the next flush, or
+        at the latest before the transaction is committed.
+        """
+        if not account_ids:
+            return
+        queue = self.env.cr.precommit.data.setdefault(REFRESH_QUEUE, set())
+        if not queue:
+            self.env.cr.precommit.add(self._flush_refresh_queue)
+        queue.update(account_ids)
+        projects = (
+            self.env["project.project"]
+            .sudo()
+            .with_context(active_test=False)
+            .search([("analytic_account_id", "in", list(account_ids))])
+        )
+        for field_name in (
+            "purchase_count",
+            "purchase_line_total",
+            "purchase_invoice_count",
+            "purchase_invoice_line_total",
+        ):
+            self.env.add_to_compute(projects._fields[field_name], projects)
+
+    @api.model
+    def _queue_lines(self, lines, account_ids=()):
+        """Queue a summary refresh of the analytic accounts used by ``lines``.
+
+        :param account_ids: extra analytic accounts to refresh, such as the ones
+            the lines were distributed to before being modified.
+        """
+        self._queue_accounts(
+            self._get_distribution_account_ids(lines).union(account_ids)
+        )
+
+    @api.model
+    def _process_refresh_queue(self):
+        """Refresh the summaries of all the queued analytic accounts at once."""
+        queue = self.env.cr.precommit.data.get(REFRESH_QUEUE)
+        if not queue:
+            return
+        account_ids = list(queue)
+        queue.clear()
+        self._refresh_accounts(account_ids)
+
+    @api.model
+    def _flush_refresh_queue(self):
+        """Process the refresh queue before the transaction is committed."""
+        self._process_refresh_queue()
+        self.env.flush_all()
+
+    @api.model
+    def _cron_rebuild(self, batch_size=1000):
+        """Rebuild all summaries, fixing any drift of the incremental updates."""
+        self.env.flush_all()
+        self._cr.execute(
+            """
+            SELECT regexp_split_to_table(
+                jsonb_object_keys(analytic_distribution), ','
+            )::integer
+            FROM purchase_order_line
+            WHERE analytic_distribution IS NOT NULL
+            UNION
+            SELECT regexp_split_to_table(
+                jsonb_object_keys(analytic_distribution), ','
+            )::integer
+            FROM account_move_line
+            WHERE analytic_distribution IS NOT NULL
+            UNION
+            SELECT account_id FROM project_purchase_summary
+            """
+        )
+        account_ids = sorted(row[0] for row in self._cr.fetchall())
+        for batch_ids in split_every(batch_size, account_ids, list):
+            self._queue_accounts(batch_ids)
+            self._process_refresh_queue()
+            self.env.flush_all()
@@ -0,0 +1,39 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import fields, models
+
+
+class PurchaseOrder(models.Model):
+    _inherit = "purchase.order"
+
+    # Technical field: only searchable, to filter the records of a project
+    analytic_project_id = fields.Many2one(
+        comodel_name="project.project",
+        string="Project",
+        store=False,
+        search="_search_analytic_project_id",
+    )
+
+    # Fields whose change may alter the totals of the analytic accounts:
+    # cancelled purchases are left out, and the amounts are converted at the
+    # rate of the order date
+    _project_purchase_summary_fields = ("currency_id", "date_order", "state")
+
+    def _search_analytic_project_id(self, operator, value):
+        account_ids = self.env["project.project"]._get_search_analytic_account_ids(
+            operator, value
+        )
+        return [("order_line.analytic_distribution_search", "in", account_ids)]
+
+    def write(self, vals):
+        result = super().write(vals)
+        if set(self._project_purchase_summary_fields).intersection(vals):
+            self.env["project.purchase.summary"]._queue_lines(self.order_line)
+        return result
+
+    def unlink(self):
+        summary_model = self.env["project.purchase.summary"]
+        account_ids = summary_model._get_distribution_account_ids(self.order_line)
+        result = super().unlink()
+        summary_model._queue_accounts(account_ids)
+        return result
@@ -0,0 +1,29 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import fields, models
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = "res.config.settings"
+
+    project_purchase_weighted_distribution = fields.Boolean(
+        string="Weighted Purchase Totals",
+        config_parameter="project_purchase_link.weighted_distribution",
+        help=(
+            "Add to the purchase totals of a project only the percentage of each "
+            "line distributed to its analytic account, instead of the full amount."
+        ),
+    )
+
+    def set_values(self):
+        param_model = self.env["ir.config_parameter"].sudo()
+        weighted = param_model.get_param("project_purchase_link.weighted_distribution")
+        res = super().set_values()
+        # The stored totals must be computed again in the new mode
+        if weighted != param_model.get_param(
+            "project_purchase_link.weighted_distribution"
+        ):
+            self.env.ref(
+                "project_purchase_link.ir_cron_project_purchase_summary_rebuild"
+            )._trigger()
+        return res
@@ -0,0 +1,193 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+import logging
+import random
+import time
+import tracemalloc
+from functools import partial
+
+from odoo.tests import common
+
+_logger = logging.getLogger(__name__)
+
+
+class TestProjectPurchaseBenchmark(common.TransactionCase):
+    """Measure the purchase KPIs of projects on generated data.
+
+    Each measured operation fails the test when it goes over its thresholds of
+    query count, wall time or peak memory. Subclasses may raise the data sizes
+    to benchmark larger databases.
+    """
+
+    project_count = 30
+    order_count = 40
+    lines_per_order = 5
+    seed = 42
+    # Thresholds per measured operation
+    max_queries = {
+        "_refresh_accounts": 10,
+        "_compute_purchase_info": 4,
+        "_compute_purchase_invoice_info": 4,
+        "button_open_purchase_order": 4,
+        "button_open_purchase_order_line": 4,
+        "button_open_purchase_invoice": 6,
+        "button_open_purchase_invoice_line": 4,
+    }
+    max_duration = 5.0
+    max_peak_memory = 32 * 1024 * 1024
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True))
+        cls.partner = cls.env.ref("base.res_partner_2")
+        cls.product = cls.env["product.product"].create(
+            {"name": "Benchmark Product", "type": "consu", "standard_price": 10}
+        )
+        cls.projects = cls.env["project.project"].create(
+            [
+                {"name": f"Benchmark Project {index}"}
+                for index in range(cls.project_count)
+            ]
+        )
+        cls._generate_purchases(random.Random(cls.seed))
+        cls.env.flush_all()
+
+    @classmethod
+    def _random_distribution(cls, rng):
+        """Return a distribution over 1 to 3 of the project analytic accounts."""
+        account_ids = rng.sample(
+            cls.projects.analytic_account_id.ids, rng.choice([1, 1, 1, 2, 3])
+        )
+        bounds = [0, *sorted(rng.sample(range(1, 100), len(account_ids) - 1)), 100]
+        return {
+            account_id: bounds[index + 1] - bounds[index]
+            for index, account_id in enumerate(account_ids)
+        }
+
+    @classmethod
+    def _generate_purchases(cls, rng):
+        """Create purchase orders and, for half of them, their vendor bill."""
+        line_values = [
+            [
+                {
+                    "product_id": cls.product.id,
+                    "analytic_distribution": cls._random_distribution(rng),
+                    "price_unit": rng.randint(1, 1000),
+                    "quantity": rng.randint(1, 20),
+                }
+                for __ in range(cls.lines_per_order)
+            ]
+            for __ in range(cls.order_count)
+        ]
+        cls.purchases = cls.env["purchase.order"].create(
+            [
+                {
+                    "partner_id": cls.partner.id,
+                    "order_line": [
+                        (
+                            0,
+                            0,
+                            {
+                                "product_id": values["product_id"],
+                                "analytic_distribution": values[
+                                    "analytic_distribution"
+                                ],
+                                "price_unit": values["price_unit"],
+                                "product_qty": values["quantity"],
+                            },
+                        )
+                        for values in order_values
+                    ],
+                }
+                for order_values in line_values
+            ]
+        )
+        cls.invoices = cls.env["account.move"].create(
+            [
+                {
+                    "move_type": "in_invoice",
+                    "partner_id": cls.partner.id,
+                    "invoice_line_ids": [(0, 0, values) for values in order_values],
+                }
+                for order_values in line_values[::2]
+            ]
+        )
+
+    def _measure(self, name, function):
+        """Run ``function`` and check its query count, duration and peak memory."""
+        self.env.invalidate_all()
+        tracemalloc.start()
+        queries_before = self.env.cr.sql_log_count
+        start = time.perf_counter()
+        try:
+            function()
+            duration = time.perf_counter() - start
+            queries = self.env.cr.sql_log_count - queries_before
+            peak_memory = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+        _logger.info(
+            "%s: %d queries, %.3fs, %.1f KiB peak memory",
+            name,
+            queries,
+            duration,
+            peak_memory / 1024,
+        )
+        self.assertLessEqual(queries, self.max_queries[name], name)
+        self.assertLessEqual(duration, self.max_duration, name)
+        self.assertLessEqual(peak_memory, self.max_peak_memory, name)
+        return queries
+
+    def test_benchmark_summary(self):
+        summary_model = self.env["project.purchase.summary"]
+        self._measure(
+            "_refresh_accounts",
+            lambda: summary_model._refresh_accounts(
+                self.projects.analytic_account_id.ids
+            ),
+        )
+
+    def _recompute(self, projects, field_name):
+        self.env.add_to_compute(projects._fields[field_name], projects)
+        projects.mapped(field_name)
+
+    def test_benchmark_compute(self):
+        half = self.projects[: self.project_count // 2]
+        for method, field_name in (
+            ("_compute_purchase_info", "purchase_count"),
+            ("_compute_purchase_invoice_info", "purchase_invoice_count"),
+        ):
+            # Warm up the caches not related to the projects
+            self._recompute(self.projects, field_name)
+            queries = self._measure(
+                method, partial(self._recompute, self.projects, field_name)
+            )
+            # No query per project
+            self.assertEqual(
+                self._measure(method, partial(self._recompute, half, field_name)),
+                queries,
+            )
+
+    def test_benchmark_actions(self):
+        project = self.projects[0]
+        for method in (
+            "button_open_purchase_order",
+            "button_open_purchase_order_line",
+            "button_open_purchase_invoice",
+            "button_open_purchase_invoice_line",
+        ):
+            action = getattr(project, method)()
+            model = self.env[action["res_model"]]
+            domain = action["domain"] + [("analytic_project_id", "=", project.id)]
+            # Warm up the caches not related to the project records
+            model.search(domain, limit=80)
+
+            def open_first_page(method=method, model=model):
+                action = getattr(project, method)()
+                model.search(
+                    action["domain"] + [("analytic_project_id", "=", project.id)],
+                    limit=80,
+                )
+
+            self._measure(method, open_first_page)
@@ -1,9 +1,11 @@
 # Copyright 2019 Oihane Crucelaegui - AvanzOSC
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
 
-from odoo.osv import expression
+from datetime import timedelta
+
+from odoo import fields
+from odoo.exceptions import UserError
 from odoo.tests import common
-from odoo.tools.safe_eval import safe_eval
 
 
 class TestProjectPurchaseUtilities(common.TransactionCase):
@@ -91,21 +93,289 @@ class TestProjectPurchaseUtilities(common.TransactionCase):
         purchase_domain = self.project._domain_purchase_order_line()
 
         lines = self.env["purchase.order.line"].search(purchase_domain)
-        order_domain = [("id", "in", lines.mapped("order_id").ids)]
+        self.assertEqual(lines, self.purchase.order_line)
+        order_domain = self.project._domain_purchase_order()
+        self.assertEqual(self.purchase_model.search(order_domain), self.purchase)
+
+        # The actions filter on the project with a search facet
+        project_context = {"search_default_analytic_project_id": self.project.id}
+        project_domain = [("analytic_project_id", "=", self.project.id)]
         purchase_dict = self.project.button_open_purchase_order()
-        self.assertEqual(purchase_dict.get("domain"), order_domain)
+        self.assertEqual(purchase_dict.get("context"), project_context)
+        self.assertEqual(
+            self.purchase_model.search(purchase_dict["domain"] + project_domain),
+            self.purchase,
+        )
         purchase_line_dict = self.project.button_open_purchase_order_line()
-        self.assertEqual(purchase_line_dict.get("domain"), purchase_domain)
-
-        action = self.env.ref("account.action_move_in_invoice_type")
-        invoice_domain = expression.AND(
-            [safe_eval(action.domain or "[]"), self.project._domain_purchase_invoice()]
-        )  # only one test invoice (line)
+        self.assertEqual(purchase_line_dict.get("context"), project_context)
+        self.assertEqual(
+            self.env["purchase.order.line"].search(
+                purchase_line_dict["domain"] + project_domain
+            ),
+            self.purchase.order_line,
+        )
 
+        self.assertEqual(
+            self.invoice_model.search(self.project._domain_purchase_invoice()),
+            invoice,
+        )
         invoice_dict = self.project.button_open_purchase_invoice()
-        self.assertEqual(invoice_dict.get("domain"), invoice_domain)
+        self.assertEqual(
+            invoice_dict["context"].get("search_default_analytic_project_id"),
+            self.project.id,
+        )
+        self.assertEqual(
+            self.invoice_model.search(invoice_dict["domain"] + project_domain),
+            invoice,
+        )
 
         invoice_line_domain = self.project._domain_purchase_invoice_line()
-
+        self.assertEqual(
+            self.invoice_line_model.search(invoice_line_domain),
+            invoice.invoice_line_ids,
+        )
         invoice_line_dict = self.project.button_open_purchase_invoice_line()
-        self.assertEqual(invoice_line_dict.get("domain"), invoice_line_domain)
+        self.assertEqual(invoice_line_dict.get("context"), project_context)
+        self.assertEqual(
+            self.invoice_line_model.search(
+                invoice_line_dict["domain"] + project_domain
+            ),
+            invoice.invoice_line_ids,
+        )
+
+    def test_analytic_project_search(self):
+        other_project = self.project_model.create({"name": "Other Project"})
+        line = self._create_purchase_line(
+            self.purchase, {self.project.analytic_account_id.id: 100}
+        )
+        line_model = self.env["purchase.order.line"]
+        self.assertEqual(
+            line_model.search([("analytic_project_id", "=", self.project.id)]), line
+        )
+        self.assertEqual(
+            line_model.search([("analytic_project_id", "ilike", "Test Proj")]), line
+        )
+        self.assertFalse(
+            line_model.search([("analytic_project_id", "in", other_project.ids)])
+        )
+        with self.assertRaises(UserError):
+            line_model.search([("analytic_project_id", "!=", self.project.id)])
+
+    def _create_purchase_line(self, purchase, analytic_distribution, price_unit=50):
+        return self.env["purchase.order.line"].create(
+            {
+                "order_id": purchase.id,
+                "name": "Test line",
+                "analytic_distribution": analytic_distribution,
+                "price_unit": price_unit,
+                "product_qty": 4,
+                "product_uom": self.product.uom_id.id,
+                "product_id": self.product.id,
+            }
+        )
+
+    def _count_compute_queries(self, projects):
+        projects.invalidate_recordset()
+        queries_before = self.env.cr.sql_log_count
+        projects.mapped("purchase_count")
+        projects.mapped("purchase_invoice_count")
+        return self.env.cr.sql_log_count - queries_before
+
+    def test_project_purchase_batch(self):
+        """Purchase KPIs of a batch of projects cost a constant number of queries."""
+        projects = self.project | self.project_model.create(
+            [{"name": "Test Project 2"}, {"name": "Test Project 3"}]
+        )
+        self._create_purchase_line(
+            self.purchase,
+            {
+                projects[0].analytic_account_id.id: 50,
+                projects[1].analytic_account_id.id: 50,
+            },
+        )
+        other_purchase = self.purchase_model.create({"partner_id": self.partner.id})
+        self._create_purchase_line(
+            other_purchase, {projects[1].analytic_account_id.id: 100}, price_unit=25
+        )
+        self.env.invalidate_all()
+        self.assertEqual(projects.mapped("purchase_count"), [1, 2, 0])
+        self.assertEqual(projects.mapped("purchase_line_total"), [200, 300, 0])
+        # Warm up caches (record rules, etc.) before counting queries
+        self._count_compute_queries(projects[0])
+        self.assertEqual(
+            self._count_compute_queries(projects[0]),
+            self._count_compute_queries(projects),
+        )
+
+    def test_project_purchase_domain_size(self):
+        """Drill-down domains do not grow with the number of matching lines."""
+        domain = self.project._domain_purchase_order_line()
+        for _i in range(5):
+            self._create_purchase_line(
+                self.purchase, {self.project.analytic_account_id.id: 100}
+            )
+        self.assertEqual(self.project._domain_purchase_order_line(), domain)
+        self.assertEqual(
+            self.env["purchase.order.line"].search_count(domain),
+            len(self.purchase.order_line),
+        )
+
+    def test_analytic_distribution_index(self):
+        """The planner can serve analytic distribution lookups with an index."""
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        self.addCleanup(self.env.cr.execute, "RESET enable_seqscan")
+        for model_name in ("purchase.order.line", "account.move.line"):
+            table = self.env[model_name]._table
+            self.env.cr.execute(
+                f"""
+                EXPLAIN SELECT id FROM {table}
+                WHERE analytic_distribution ?| %s
+                """,
+                [[str(self.project.analytic_account_id.id)]],
+            )
+            plan = "\n".join(row[0] for row in self.env.cr.fetchall())
+            self.assertNotIn("Seq Scan", plan)
+            self.assertIn(f"{table}_analytic_distribution_gin_index", plan)
+
+    def test_project_purchase_summary(self):
+        """Summaries follow purchase changes and let projects be searched."""
+        other_project = self.project_model.create({"name": "Test Project 2"})
+        account = self.project.analytic_account_id
+        line = self._create_purchase_line(self.purchase, {account.id: 100})
+        summary = self.env["project.purchase.summary"].search(
+            [("account_id", "=", account.id)]
+        )
+        self.assertEqual(summary.purchase_count, 1)
+        self.assertEqual(summary.purchase_line_total, 200)
+        projects = self.project | other_project
+        self.assertEqual(
+            projects.filtered_domain([("purchase_count", ">", 0)]), self.project
+        )
+        self.assertEqual(
+            self.project_model.search(
+                [("id", "in", projects.ids), ("purchase_line_total", "=", 0)]
+            ),
+            other_project,
+        )
+        self.assertEqual(
+            self.project_model.search(
+                [("id", "in", projects.ids)], order="purchase_line_total desc"
+            ).ids,
+            [self.project.id, other_project.id],
+        )
+        groups = self.project_model.read_group(
+            [("id", "in", projects.ids)], ["purchase_line_total"], []
+        )
+        self.assertEqual(groups[0]["purchase_line_total"], 200)
+        # Moving the line to another project updates both summaries
+        line.analytic_distribution = {other_project.analytic_account_id.id: 100}
+        self.env.invalidate_all()
+        self.assertEqual(self.project.purchase_count, 0)
+        self.assertEqual(other_project.purchase_count, 1)
+        # Cancelled purchases are not counted
+        self.purchase.button_cancel()
+        self.env.invalidate_all()
+        self.assertEqual(other_project.purchase_count, 0)
+        self.assertEqual(other_project.purchase_line_total, 0)
+        # The full rebuild agrees with the incremental updates
+        self.purchase.button_draft()
+        summaries = self.env["project.purchase.summary"].search([])
+        values = summaries.read(["account_id", "purchase_count", "purchase_line_total"])
+        summaries.write({"purchase_count": 0, "purchase_line_total": 0})
+        self.env["project.purchase.summary"]._cron_rebuild()
+        self.assertEqual(
+            summaries.read(["account_id", "purchase_count", "purchase_line_total"]),
+            values,
+        )
+        self.env.invalidate_all()
+        self.assertEqual(other_project.purchase_count, 1)
+
+    def test_project_purchase_multi_currency(self):
+        """Purchases in foreign currency are converted to company currency."""
+        company = self.env.company
+        currency = self.env["res.currency"].create(
+            {"name": "PPL", "symbol": "P", "rounding": 0.01}
+        )
+        self.env["res.currency.rate"].create(
+            {
+                "name": fields.Date.today(),
+                "currency_id": currency.id,
+                "company_id": company.id,
+                "rate": company.currency_id.with_company(company).rate * 4,
+            }
+        )
+        foreign_purchase = self.purchase_model.create(
+            {"partner_id": self.partner.id, "currency_id": currency.id}
+        )
+        account = self.project.analytic_account_id
+        self._create_purchase_line(self.purchase, {account.id: 100}, price_unit=25)
+        self._create_purchase_line(foreign_purchase, {account.id: 100}, price_unit=100)
+        self.env.invalidate_all()
+        self.assertEqual(self.project.purchase_count, 2)
+        # 4 x 25 in company currency + 4 x 100 / 4 in foreign currency
+        self.assertAlmostEqual(self.project.purchase_line_total, 200, places=2)
+        # Without a rate at the order date, the foreign currency is at rate 1
+        foreign_purchase.date_order = fields.Datetime.now() - timedelta(days=30)
+        self.env.invalidate_all()
+        self.assertAlmostEqual(
+            self.project.purchase_line_total,
+            100 + 400 * company.currency_id.with_company(company).rate,
+            places=2,
+        )
+
+    def test_project_purchase_weighted(self):
+        """Weighted totals only count the distributed percentage of lines."""
+        projects = self.project | self.project_model.create({"name": "Test Project 2"})
+        self._create_purchase_line(
+            self.purchase,
+            {
+                projects[0].analytic_account_id.id: 10,
+                projects[1].analytic_account_id.id: 90,
+            },
+        )
+        self.env.invalidate_all()
+        self.assertEqual(projects.mapped("purchase_line_total"), [200, 200])
+        self.env["ir.config_parameter"].set_param(
+            "project_purchase_link.weighted_distribution", "True"
+        )
+        self.env["project.purchase.summary"]._cron_rebuild()
+        self.env.invalidate_all()
+        self.assertEqual(projects.mapped("purchase_line_total"), [20, 180])
+        self.assertEqual(projects.mapped("purchase_count"), [1, 1])
+
+    def test_project_purchase_multi_plan(self):
+        """Distributions over several analytic plans count for each account."""
+        plan = self.env["account.analytic.plan"].create({"name": "Other Plan"})
+        other_account = self.env["account.analytic.account"].create(
+            {"name": "Other Account", "plan_id": plan.id}
+        )
+        account = self.project.analytic_account_id
+        line = self._create_purchase_line(
+            self.purchase, {f"{account.id},{other_account.id}": 100}
+        )
+        self.env.invalidate_all()
+        self.assertEqual(self.project.purchase_count, 1)
+        self.assertEqual(self.project.purchase_line_total, 200)
+        # Multi-plan lines can be edited, and their accounts are refreshed
+        line.price_unit = 100
+        self.env.invalidate_all()
+        self.assertEqual(self.project.purchase_line_total, 400)
+        summary_model = self.env["project.purchase.summary"]
+        other_summary = summary_model.search([("account_id", "=", other_account.id)])
+        self.assertEqual(other_summary.purchase_line_total, 400)
+        # An account in several keys of a line counts the line once
+        line.analytic_distribution = {
+            str(account.id): 40,
+            f"{account.id},{other_account.id}": 60,
+        }
+        summary_model._cron_rebuild()
+        self.env.invalidate_all()
+        self.assertEqual(self.project.purchase_count, 1)
+        self.assertEqual(self.project.purchase_line_total, 400)
+        self.env["ir.config_parameter"].set_param(
+            "project_purchase_link.weighted_distribution", "True"
+        )
+        summary_model._cron_rebuild()
+        self.env.invalidate_all()
+        self.assertEqual(self.project.purchase_line_total, 400)
+        self.assertEqual(other_summary.purchase_line_total, 240)
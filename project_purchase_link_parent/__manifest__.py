@@ -0,0 +1,15 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+{
+    "name": "Project Purchase Link Parent",
+    "summary": "Roll up the purchase totals of projects over their sub-projects",
+    "version": "17.0.1.0.0",
+    "license": "AGPL-3",
+    "depends": ["project_parent", "project_purchase_link"],
+    "author": "Odoo Community Association (OCA)",
+    "website": "https://github.com/OCA/project",
+    "category": "Project",
+    "data": ["views/project_project_view.xml"],
+    "installable": True,
+    "auto_install": True,
+}
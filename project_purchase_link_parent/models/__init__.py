@@ -0,0 +1 @@
+from . import project_project
@@ -0,0 +1,118 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import api, fields, models
+from odoo.osv import expression
+
+
+class ProjectProject(models.Model):
+    _inherit = "project.project"
+
+    rollup_purchase_count = fields.Integer(
+        compute="_compute_rollup_purchase_info",
+        string="# Purchase (Tree)",
+    )
+    rollup_purchase_line_total = fields.Monetary(
+        compute="_compute_rollup_purchase_info",
+        string="Tree Purchase Total",
+    )
+    rollup_purchase_invoice_count = fields.Integer(
+        compute="_compute_rollup_purchase_info",
+        string="# Purchase Invoice (Tree)",
+    )
+    rollup_purchase_invoice_line_total = fields.Monetary(
+        compute="_compute_rollup_purchase_info",
+        string="Tree Purchase Invoice Total",
+    )
+
+    def _get_rollup_projects(self):
+        """Return the projects and all their sub-projects, archived included."""
+        return self.with_context(active_test=False).search(
+            [("id", "child_of", self.ids)]
+        )
+
+    def _read_rollup_totals(self, line_query, weighted=False):
+        """Aggregate the result of an amounts query of ``project.purchase.summary``
+        over the tree of each project.
+
+        A line distributed to several projects of a tree is counted once for it,
+        with its full amount or, if ``weighted``, the sum of its distributed
+        percentages.
+
+        :return: dict mapping project ids to ``(count, total)``
+        """
+        query_string, query_param = line_query
+        distinct = "root.id, line.line_id"
+        if weighted:
+            # Projects may share an analytic account
+            distinct += ", line.account_key"
+        self._cr.execute(
+            f"""
+            SELECT tree_line.root_id,
+                COUNT(DISTINCT tree_line.group_id),
+                SUM(tree_line.amount)
+            FROM (
+                SELECT DISTINCT ON ({distinct})
+                    root.id AS root_id, line.group_id, line.amount
+                FROM project_project AS root
+                JOIN project_project AS project
+                    ON project.parent_path LIKE root.parent_path || '%%'
+                JOIN ({query_string}) AS line
+                    ON line.account_key = project.analytic_account_id::text
+                WHERE root.id = ANY(%s)
+            ) AS tree_line
+            GROUP BY tree_line.root_id
+            """,
+            [*query_param, self.ids],
+        )
+        return {
+            project_id: (count, total or 0)
+            for project_id, count, total in self._cr.fetchall()
+        }
+
+    @api.depends("analytic_account_id", "parent_path")
+    def _compute_rollup_purchase_info(self):
+        projects = self.filtered("id")
+        account_ids = projects._get_rollup_projects().analytic_account_id.ids
+        purchase_totals = invoice_totals = {}
+        if account_ids:
+            projects.flush_model(["parent_path", "analytic_account_id"])
+            summary_model = self.env["project.purchase.summary"].sudo()
+            weighted = summary_model._is_weighted()
+            purchase_totals = projects._read_rollup_totals(
+                summary_model._get_purchase_line_amounts_query(
+                    account_ids, weighted=weighted
+                ),
+                weighted=weighted,
+            )
+            invoice_totals = projects._read_rollup_totals(
+                summary_model._get_invoice_line_amounts_query(
+                    account_ids, weighted=weighted
+                ),
+                weighted=weighted,
+            )
+        for project in self:
+            purchase_count, purchase_line_total = purchase_totals.get(
+                project.id, (0, 0)
+            )
+            invoice_count, invoice_line_total = invoice_totals.get(project.id, (0, 0))
+            project.rollup_purchase_count = purchase_count
+            project.rollup_purchase_line_total = purchase_line_total
+            project.rollup_purchase_invoice_count = invoice_count
+            project.rollup_purchase_invoice_line_total = invoice_line_total
+
+    def _get_rollup_action(self, action):
+        """Show the records of the whole project tree in ``action``."""
+        action["context"].pop("search_default_analytic_project_id")
+        action["domain"] = expression.AND(
+            [
+                action["domain"],
+                [("analytic_project_id", "in", self._get_rollup_projects().ids)],
+            ]
+        )
+        return action
+
+    def button_open_rollup_purchase_order_line(self):
+        return self._get_rollup_action(self.button_open_purchase_order_line())
+
+    def button_open_rollup_purchase_invoice_line(self):
+        return self._get_rollup_action(self.button_open_purchase_invoice_line())
@@ -0,0 +1 @@
+from . import test_project_purchase_link_parent
@@ -0,0 +1,95 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo.tests import common
+
+
+class TestProjectPurchaseLinkParent(common.TransactionCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(cls.env.context, tracking_disable=True))
+        cls.project_model = cls.env["project.project"]
+        cls.root = cls.project_model.create({"name": "Root Project"})
+        cls.child = cls.project_model.create(
+            {"name": "Child Project", "parent_id": cls.root.id}
+        )
+        cls.grandchild = cls.project_model.create(
+            {"name": "Grandchild Project", "parent_id": cls.child.id}
+        )
+        cls.other = cls.project_model.create({"name": "Other Project"})
+        cls.product = cls.env["product.product"].create(
+            {"name": "Product", "type": "consu"}
+        )
+        cls.purchase = cls.env["purchase.order"].create(
+            {"partner_id": cls.env.ref("base.res_partner_2").id}
+        )
+
+    def _create_purchase_line(self, analytic_distribution, price_unit=50):
+        return self.env["purchase.order.line"].create(
+            {
+                "order_id": self.purchase.id,
+                "name": "Test line",
+                "analytic_distribution": analytic_distribution,
+                "price_unit": price_unit,
+                "product_qty": 4,
+                "product_uom": self.product.uom_id.id,
+                "product_id": self.product.id,
+            }
+        )
+
+    def test_rollup_purchase(self):
+        projects = self.root | self.child | self.grandchild | self.other
+        self.assertEqual(projects.mapped("rollup_purchase_count"), [0, 0, 0, 0])
+        self._create_purchase_line({self.root.analytic_account_id.id: 100})
+        grandchild_line = self._create_purchase_line(
+            {self.grandchild.analytic_account_id.id: 100}, 25
+        )
+        self._create_purchase_line({self.other.analytic_account_id.id: 100}, 10)
+        self.env.invalidate_all()
+        # The order spread over the tree is only counted once
+        self.assertEqual(projects.mapped("rollup_purchase_count"), [1, 1, 1, 1])
+        self.assertEqual(
+            projects.mapped("rollup_purchase_line_total"), [300, 100, 100, 40]
+        )
+        self.assertEqual(self.root.purchase_line_total, 200)
+        self.assertEqual(projects.mapped("rollup_purchase_invoice_count"), [0] * 4)
+        action = self.child.button_open_rollup_purchase_order_line()
+        self.assertEqual(
+            self.env["purchase.order.line"].search(action["domain"]), grandchild_line
+        )
+
+    def test_rollup_purchase_split_line(self):
+        """A line split between projects of a tree is counted once."""
+        projects = self.root | self.child
+        self._create_purchase_line(
+            {
+                self.root.analytic_account_id.id: 30,
+                self.child.analytic_account_id.id: 70,
+            }
+        )
+        self.env.invalidate_all()
+        self.assertEqual(projects.mapped("rollup_purchase_count"), [1, 1])
+        self.assertEqual(projects.mapped("rollup_purchase_line_total"), [200, 200])
+        self.env["ir.config_parameter"].set_param(
+            "project_purchase_link.weighted_distribution", "True"
+        )
+        self.env.invalidate_all()
+        self.assertEqual(projects.mapped("rollup_purchase_line_total"), [200, 140])
+
+    def _count_rollup_queries(self, projects):
+        self.env.invalidate_all()
+        queries_before = self.env.cr.sql_log_count
+        projects.mapped("rollup_purchase_line_total")
+        return self.env.cr.sql_log_count - queries_before
+
+    def test_rollup_purchase_queries(self):
+        self._create_purchase_line({self.grandchild.analytic_account_id.id: 100})
+        self.env.flush_all()
+        # The first read fills the ormcaches, which later reads do not query
+        self._count_rollup_queries(self.root)
+        self.assertEqual(
+            self._count_rollup_queries(self.root),
+            self._count_rollup_queries(
+                self.root | self.child | self.grandchild | self.other
+            ),
+        )
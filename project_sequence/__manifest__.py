@@ -4,7 +4,7 @@
 {
     "name": "Project Sequence",
     "summary": "Add a sequence field to projects, filled automatically",
-    "version": "17.0.1.0.0",
+    "version": "17.0.1.1.0",
     "development_status": "Alpha",
     "category": "Services/Project",
     "website": "https://github.com/OCA/project",
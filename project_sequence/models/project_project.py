@@ -1,8 +1,14 @@
 # Copyright 2023 Moduon Team S.L.
 # License LGPL-3.0 or later (https://www.gnu.org/licenses/lgpl-3.0)
 
+import re
 
-from odoo import api, fields, models
+from odoo import api, fields, models, tools
+from odoo.osv import expression
+from odoo.tools import escape_psql
+
+# Search terms that may be the start of a sequence code, such as "23-000"
+SEQUENCE_CODE_PREFIX = re.compile(r"^\S*\d\S*$")
 
 
 class ProjectProject(models.Model):
@@ -20,6 +26,8 @@ class ProjectProject(models.Model):
     sequence_code = fields.Char(
         copy=False,
         readonly=True,
+        # Serves the ilike searches when pg_trgm is available
+        index="trigram",
     )
     name = fields.Char(
         # We actually require it with the SQL constraint, but it is disabled
@@ -35,10 +43,14 @@ class ProjectProject(models.Model):
                 continue
             rec.analytic_account_id.name = rec.display_name
 
-    @api.depends("sequence_code", "name")
-    def _compute_display_name(self):
-        res = super()._compute_display_name()
-        sequence_pattern = (
+    @api.model
+    @tools.ormcache()
+    def _get_display_name_pattern(self):
+        """Get the display name pattern.
+
+        It is cached in the registry, which changes to system parameters clear.
+        """
+        return (
             self.env["ir.config_parameter"]
             .sudo()
             .get_param(
@@ -46,23 +58,44 @@ class ProjectProject(models.Model):
                 default="%(sequence_code)s - %(name)s",
             )
         )
-        for project in self.filtered(
-            lambda pr: pr.sequence_code and pr.sequence_code != pr.name
-        ):
-            project.display_name = sequence_pattern % {
-                "name": project.name,
-                "sequence_code": project.sequence_code,
-            }
+
+    @api.depends("sequence_code", "name")
+    def _compute_display_name(self):
+        res = super()._compute_display_name()
+        sequence_pattern = self._get_display_name_pattern()
+        for project in self:
+            if project.sequence_code and project.sequence_code != project.name:
+                project.display_name = sequence_pattern % {
+                    "name": project.name,
+                    "sequence_code": project.sequence_code,
+                }
         return res
 
     @api.model
     def name_search(self, name="", args=None, operator="ilike", limit=100):
         """Allow searching by sequence code by default."""
         # Do not add any domain when user just clicked on search widget
-        if not (name == "" and operator == "ilike"):
-            # The dangling | is needed to combine with the domain added by super()
-            args = (args or []) + ["|", ("sequence_code", operator, name)]
-        return super().name_search(name, args, operator, limit)
+        if name == "" and operator == "ilike":
+            return super().name_search(name, args, operator, limit)
+        results = []
+        if operator == "ilike" and SEQUENCE_CODE_PREFIX.match(name):
+            # Projects whose code starts with the input come first; when they are
+            # enough, searching inside all names and codes is not needed
+            projects = self.search_fetch(
+                expression.AND(
+                    [args or [], [("sequence_code", "=ilike", f"{escape_psql(name)}%")]]
+                ),
+                ["name", "sequence_code"],
+                limit=limit,
+            )
+            results = [(project.id, project.display_name) for project in projects]
+            if limit and len(results) >= limit:
+                return results
+            args = expression.AND([args or [], [("id", "not in", projects.ids)]])
+            limit = limit and limit - len(results)
+        # The dangling | is needed to combine with the domain added by super()
+        args = (args or []) + ["|", ("sequence_code", operator, name)]
+        return results + super().name_search(name, args, operator, limit)
 
     @api.model_create_multi
     def create(self, vals_list):
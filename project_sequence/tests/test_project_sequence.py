@@ -138,6 +138,25 @@ class TestProjectSequence(TransactionCase):
         self.assertEqual(proj.display_name, "23-00013")
         self.assertEqual(proj.sequence_code, "23-00013")
 
+    def test_pattern_cache(self):
+        """Display names are computed without reading the pattern again."""
+        projects = self.env["project.project"].create(
+            [{"name": "one"}, {"name": "two"}]
+        )
+        projects.mapped("display_name")
+        projects.invalidate_recordset(["display_name"])
+        with self.assertQueryCount(0):
+            self.assertEqual(
+                projects.mapped("display_name"), ["23-00011 - one", "23-00012 - two"]
+            )
+        self.env["ir.config_parameter"].set_param(
+            "project_sequence.display_name_pattern", "%(name)s/%(sequence_code)s"
+        )
+        projects.invalidate_recordset(["display_name"])
+        self.assertEqual(
+            projects.mapped("display_name"), ["one/23-00011", "two/23-00012"]
+        )
+
     def test_sync_analytic_account_name(self):
         """Set analytic account name equal to project's display name."""
         proj = self.env["project.project"].create({"name": "one"})
@@ -182,3 +201,32 @@ class TestProjectSequence(TransactionCase):
         self.assertIn((proj2.id, "23-00012 - two"), results)
         self.assertNotIn((proj1.id, "23-00011 - one"), results)
         self.assertNotIn((proj3.id, "23-00013 - three"), results)
+
+    def test_name_search_code_prefix(self):
+        """Projects whose code starts with the input are found first."""
+        projects = self.env["project.project"].create(
+            [{"name": "one"}, {"name": "two"}, {"name": "Q3 23-0001 review"}]
+        )
+        self.assertEqual(
+            projects.mapped("sequence_code"), ["23-00011", "23-00012", "23-00013"]
+        )
+        results = self.env["project.project"].name_search("23-0001", limit=2)
+        self.assertEqual(len(results), 2)
+        self.assertTrue(
+            set(dict(results)).issubset(projects.ids),
+        )
+        # Names are still searched when codes are not enough
+        results = self.env["project.project"].name_search("Q3")
+        self.assertEqual([result[0] for result in results], projects[2].ids)
+        results = self.env["project.project"].name_search("23-00012")
+        self.assertEqual([result[0] for result in results], projects[1].ids)
+        if self.env.registry.has_trigram:
+            self.env.cr.execute(
+                """
+                SELECT indexdef
+                FROM pg_indexes
+                WHERE tablename = 'project_project'
+                    AND indexname = 'project_project__sequence_code_index'
+                """
+            )
+            self.assertIn("gin_trgm_ops", self.env.cr.fetchone()[0])
@@ -6,19 +6,24 @@
 
 {
     "name": "Project timesheet time control",
-    "version": "17.0.1.0.1",
+    "version": "17.0.1.5.1",
     "category": "Project",
     "author": "Tecnativa," "Odoo Community Association (OCA)",
     "maintainers": ["ernestotejeda"],
     "website": "https://github.com/OCA/project",
     "depends": [
+        "bus",
         "hr_timesheet",
     ],
     "data": [
         "security/ir.model.access.csv",
+        "security/ir_rule_data.xml",
+        "data/ir_cron.xml",
+        "report/hr_timesheet_overlap_report_views.xml",
         "views/account_analytic_line_view.xml",
         "views/project_project_view.xml",
         "views/project_task_view.xml",
+        "views/res_config_settings_view.xml",
         "wizards/hr_timesheet_switch_view.xml",
     ],
     "license": "AGPL-3",
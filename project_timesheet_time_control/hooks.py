@@ -3,7 +3,8 @@
 
 
 def post_init_hook(env):
-    """Put the date with 00:00:00 as the date_time for the line."""
+    """Put the date with 00:00:00 as the date_time for the line, then register
+    the running timers."""
     env.cr.execute(
         """UPDATE account_analytic_line
         SET date_time = to_timestamp(date || ' 00:00:00',
@@ -11,3 +12,4 @@ def post_init_hook(env):
         WHERE date(date_time) != date
         """
     )
+    env["hr.timesheet.running.timer"]._rebuild()
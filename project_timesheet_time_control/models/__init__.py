@@ -1,6 +1,10 @@
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
 
 from . import account_analytic_line
+from . import hr_timesheet_running_timer
 from . import hr_timesheet_time_control_mixin
+from . import ir_websocket
 from . import project_project
 from . import project_task
+from . import res_config_settings
+from . import res_users
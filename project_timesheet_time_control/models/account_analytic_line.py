@@ -3,17 +3,36 @@
 # Copyright 2016-2018 Tecnativa - Pedro M. Baeza
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
 
-from datetime import datetime
+from collections import defaultdict
+from datetime import datetime, time, timedelta
 
-from dateutil.relativedelta import relativedelta
+import pytz
 
-from odoo import _, api, fields, models
+from odoo import _, api, fields, models, modules
 from odoo.exceptions import UserError
+from odoo.tools.misc import split_every, str2bool
+from odoo.tools.sql import column_exists, create_column, create_index
 
 
 class AccountAnalyticLine(models.Model):
     _inherit = "account.analytic.line"
     _order = "date_time desc"
+    _sql_constraints = [
+        (
+            "timer_uuid_uniq",
+            "UNIQUE(timer_uuid)",
+            "A timer recorded offline can only be synchronized once",
+        ),
+    ]
+
+    # Fields deciding whether a line is the running timer of its employee
+    _running_timer_fields = (
+        "date_time",
+        "employee_id",
+        "project_id",
+        "task_id",
+        "unit_amount",
+    )
 
     date_time = fields.Datetime(
         string="Start Time", default=fields.Datetime.now, copy=False
@@ -22,6 +41,13 @@ class AccountAnalyticLine(models.Model):
         string="End Time",
         compute="_compute_date_time_end",
         inverse="_inverse_date_time_end",
+        store=True,
+    )
+    timer_uuid = fields.Char(
+        string="Timer UUID",
+        copy=False,
+        readonly=True,
+        help="Identifier given by the client that recorded the timer offline.",
     )
     show_time_control = fields.Selection(
         selection=[("resume", "Resume"), ("stop", "Stop")],
@@ -29,6 +55,63 @@ class AccountAnalyticLine(models.Model):
         help="Indicate which time control button to show, if any.",
     )
 
+    def _auto_init(self):
+        # Pre-create and fill the date_time_end column for avoiding a costly
+        # computation on big timesheet tables
+        cr = self.env.cr
+        if not column_exists(cr, self._table, "date_time_end"):
+            create_column(cr, self._table, "date_time_end", "timestamp")
+            hour_uom = self.env.ref("uom.product_uom_hour", raise_if_not_found=False)
+            if hour_uom:
+                cr.execute(
+                    f"""
+                    UPDATE {self._table}
+                    SET date_time_end = date_time + unit_amount * INTERVAL '1 hour'
+                    WHERE date_time IS NOT NULL
+                    AND unit_amount != 0
+                    AND product_uom_id = %s
+                    """,
+                    [hour_uom.id],
+                )
+        return super()._auto_init()
+
+    def init(self):
+        super().init()
+        # Last line of an employee per task, or per project for lines without
+        # task, as suggested by the switch wizard
+        create_index(
+            self.env.cr,
+            f"{self._table}_employee_task_date_time_index",
+            self._table,
+            ["employee_id", "task_id", "date_time DESC"],
+        )
+        create_index(
+            self.env.cr,
+            f"{self._table}_employee_project_date_time_index",
+            self._table,
+            ["employee_id", "project_id", "date_time DESC"],
+            where="task_id IS NULL",
+        )
+        # Time range of the lines, for finding overlapping entries
+        create_index(
+            self.env.cr,
+            f"{self._table}_date_time_range_index",
+            self._table,
+            ["tsrange(date_time, date_time_end)"],
+            method="gist",
+            where="date_time_end >= date_time",
+        )
+        # Running timers are a tiny fraction of the timesheet history; these
+        # partial indexes keep their lookups independent of the table size
+        for field_name in ("employee_id", "user_id"):
+            create_index(
+                self.env.cr,
+                f"{self._table}_running_{field_name}_index",
+                self._table,
+                [field_name],
+                where="date_time IS NOT NULL AND unit_amount = 0",
+            )
+
     @api.depends("date_time", "unit_amount", "product_uom_id")
     def _compute_date_time_end(self):
         hour_uom = self.env.ref("uom.product_uom_hour")
@@ -38,7 +121,7 @@ class AccountAnalyticLine(models.Model):
                 and record.date_time
                 and record.unit_amount
             ):
-                record.date_time_end = record.date_time + relativedelta(
+                record.date_time_end = record.date_time + timedelta(
                     hours=record.unit_amount
                 )
             else:
@@ -46,22 +129,55 @@ class AccountAnalyticLine(models.Model):
 
     def _inverse_date_time_end(self):
         hour_uom = self.env.ref("uom.product_uom_hour")
-        for record in self.filtered(lambda x: x.date_time and x.date_time_end):
-            if record.product_uom_id == hour_uom:
-                record.unit_amount = (
-                    record.date_time_end - record.date_time
-                ).seconds / 3600
+        # Lines with the same duration are written together
+        line_ids_per_duration = defaultdict(list)
+        for record in self:
+            if (
+                record.product_uom_id == hour_uom
+                and record.date_time
+                and record.date_time_end
+            ):
+                duration = record._duration(record.date_time, record.date_time_end)
+                line_ids_per_duration[duration].append(record.id)
+        for duration, line_ids in line_ids_per_duration.items():
+            self.browse(line_ids).unit_amount = duration
 
     @api.model
     def _eval_date(self, vals):
-        if vals.get("date_time"):
-            return dict(vals, date=self._convert_datetime_to_date(vals["date_time"]))
-        return vals
+        return self._eval_dates([vals])[0]
+
+    @api.model
+    def _eval_dates(self, vals_list):
+        """Return ``vals_list`` with the dates derived from the start times.
 
-    def _convert_datetime_to_date(self, datetime_):
+        The timezone is resolved once for the whole batch, and only when it has
+        start times.
+        """
+        if not any(vals.get("date_time") for vals in vals_list):
+            return vals_list
+        tz = self._get_date_tz()
+        return [
+            dict(vals, date=self._convert_datetime_to_date(vals["date_time"], tz))
+            if vals.get("date_time")
+            else vals
+            for vals in vals_list
+        ]
+
+    @api.model
+    def _get_date_tz(self):
+        """Return the timezone of the dates, as ``fields.Date.context_today``."""
+        tz_name = self.env.context.get("tz") or self.env.user.tz
+        try:
+            return pytz.timezone(tz_name) if tz_name else pytz.utc
+        except pytz.UnknownTimeZoneError:
+            return pytz.utc
+
+    def _convert_datetime_to_date(self, datetime_, tz=None):
         if isinstance(datetime_, str):
             datetime_ = fields.Datetime.from_string(datetime_)
-        return fields.Date.context_today(self, datetime_)
+        if tz is None:
+            return fields.Date.context_today(self, datetime_)
+        return pytz.utc.localize(datetime_).astimezone(tz).date()
 
     @api.model
     def _running_domain(self):
@@ -92,12 +208,44 @@ class AccountAnalyticLine(models.Model):
             else:
                 one.show_time_control = "stop"
 
+    def _get_running_timer_employees(self):
+        """Return the employees of the running lines among these ones."""
+        return self.filtered(
+            lambda line: line.date_time and not line.unit_amount and line.project_id
+        ).employee_id
+
     @api.model_create_multi
     def create(self, vals_list):
-        return super().create(list(map(self._eval_date, vals_list)))
+        """Create the lines, with their dates derived from their start times.
+
+        Bulk imports should pass all their values in one call: the dates of the
+        whole batch are derived with a single timezone lookup, and the running
+        timers of the employees are refreshed once.
+        """
+        lines = super().create(self._eval_dates(vals_list))
+        self.env["hr.timesheet.running.timer"]._refresh_employees(
+            lines._get_running_timer_employees().ids
+        )
+        return lines
 
     def write(self, vals):
-        return super().write(self._eval_date(vals))
+        # Batches of timer changes refresh the running timers by themselves
+        refresh_timers = not self.env.context.get(
+            "defer_running_timer_refresh"
+        ) and set(self._running_timer_fields).intersection(vals)
+        if not refresh_timers:
+            return super().write(self._eval_date(vals))
+        employees = self._get_running_timer_employees()
+        result = super().write(self._eval_date(vals))
+        employees |= self._get_running_timer_employees()
+        self.env["hr.timesheet.running.timer"]._refresh_employees(employees.ids)
+        return result
+
+    def unlink(self):
+        employees = self._get_running_timer_employees()
+        result = super().unlink()
+        self.env["hr.timesheet.running.timer"]._refresh_employees(employees.ids)
+        return result
 
     def button_resume_work(self):
         """Create a new record starting now, with a running timer."""
@@ -110,10 +258,45 @@ class AccountAnalyticLine(models.Model):
             "view_type": "form",
         }
 
+    def _stop_timers(self, end):
+        """Stop these running lines at ``end``."""
+        early = self.filtered(lambda line: line.date_time and line.date_time > end)
+        if early:
+            # A negative duration would hide the line from the running timers
+            raise UserError(
+                _(
+                    "Cannot stop timers %(lines)s at %(end)s, before they started. "
+                    "Check the stop time and the clock of the device."
+                )
+                % {
+                    "lines": ", ".join(str(line_id) for line_id in early.ids),
+                    "end": end,
+                }
+            )
+        self._set_timer_durations(
+            {line.id: line._duration(line.date_time, end) for line in self}
+        )
+
+    def _set_timer_durations(self, duration_per_line):
+        """Stop these running lines with their duration in ``duration_per_line``.
+
+        Lines with the same duration are written together and the running timers
+        are refreshed once.
+        """
+        line_ids_per_duration = defaultdict(list)
+        for line_id, duration in duration_per_line.items():
+            line_ids_per_duration[duration].append(line_id)
+        employees = self._get_running_timer_employees()
+        lines = self.with_context(defer_running_timer_refresh=True)
+        for duration, line_ids in line_ids_per_duration.items():
+            lines.browse(line_ids).write({"unit_amount": duration})
+        self.env["hr.timesheet.running.timer"]._refresh_employees(employees.ids)
+
     def button_end_work(self):
         end = fields.Datetime.to_datetime(
             self.env.context.get("stop_dt", datetime.now())
         )
+        self.env["hr.timesheet.running.timer"]._lock_employees(self.employee_id.ids)
         for line in self:
             if line.unit_amount:
                 raise UserError(
@@ -123,5 +306,267 @@ class AccountAnalyticLine(models.Model):
                     )
                     % line.id
                 )
-            line.unit_amount = line._duration(line.date_time, end)
+        self._stop_timers(end)
         return True
+
+    def _get_auto_stop_ends(self, max_hours, use_schedule):
+        """Return when these forgotten running lines are considered stopped.
+
+        That is after ``max_hours`` or, when ``use_schedule`` is set, at the end
+        of the last working period of the employee before, on the day the line
+        started. The working periods are computed once per working schedule.
+
+        :return: dict mapping the line ids to their end.
+        """
+        end_per_line = {
+            line.id: line.date_time + timedelta(hours=max_hours) for line in self
+        }
+        if not use_schedule:
+            return end_per_line
+        # Window of each line, grouped by working schedule
+        windows_per_calendar = defaultdict(list)
+        for line in self:
+            calendar = line.employee_id.resource_calendar_id
+            if not calendar:
+                continue
+            tz = pytz.timezone(line.employee_id.tz or calendar.tz or "UTC")
+            start = pytz.utc.localize(line.date_time)
+            day_end = tz.localize(
+                datetime.combine(
+                    start.astimezone(tz).date() + timedelta(days=1), time()
+                )
+            )
+            end = min(pytz.utc.localize(end_per_line[line.id]), day_end)
+            windows_per_calendar[calendar].append(
+                (line.id, line.employee_id.resource_id.id, start, end)
+            )
+        for calendar, windows in windows_per_calendar.items():
+            resources = self.env["resource.resource"].browse(
+                {resource_id for __, resource_id, __, __ in windows}
+            )
+            intervals_per_resource = calendar._work_intervals_batch(
+                min(start for __, __, start, __ in windows),
+                max(end for __, __, __, end in windows),
+                resources=resources,
+            )
+            for line_id, resource_id, start, end in windows:
+                work_ends = [
+                    min(stop, end)
+                    for interval_start, stop, __ in intervals_per_resource[resource_id]
+                    if interval_start < end and stop > start
+                ]
+                if work_ends:
+                    end_per_line[line_id] = (
+                        max(work_ends).astimezone(pytz.utc).replace(tzinfo=None)
+                    )
+        return end_per_line
+
+    @api.model
+    def _cron_auto_stop_timers(self, batch_size=500):
+        """Stop the timers running for longer than the configured maximum.
+
+        The lines are found in one query and stopped by batches, each one
+        committed on its own so that a big company does not hold one long
+        transaction.
+        """
+        param_model = self.env["ir.config_parameter"].sudo()
+        max_hours = float(
+            param_model.get_param(
+                "project_timesheet_time_control.auto_stop_max_hours", 0
+            )
+        )
+        if max_hours <= 0:
+            return
+        use_schedule = str2bool(
+            param_model.get_param(
+                "project_timesheet_time_control.auto_stop_working_schedule", "False"
+            )
+        )
+        line_ids = self.search(
+            [
+                ("date_time", "!=", False),
+                ("date_time", "<", datetime.now() - timedelta(hours=max_hours)),
+                ("project_id", "!=", False),
+                ("unit_amount", "=", 0),
+            ],
+            order="id",
+        ).ids
+        timer_model = self.env["hr.timesheet.running.timer"]
+        for batch_ids in split_every(batch_size, line_ids, list):
+            lines = self.browse(batch_ids)
+            timer_model._lock_employees(lines.employee_id.ids)
+            # Lines may have been stopped since they were found
+            lines = lines.filtered(lambda line: not line.unit_amount)
+            end_per_line = lines._get_auto_stop_ends(max_hours, use_schedule)
+            lines._set_timer_durations(
+                {
+                    line.id: line._duration(line.date_time, end_per_line[line.id])
+                    for line in lines
+                }
+            )
+            if not modules.module.current_test:
+                self.env.cr.commit()  # pylint: disable=invalid-commit
+            self.env.invalidate_all()
+
+    @api.model
+    def stop_employee_timers(self, employee_ids, stop_dt=None):
+        """Stop the running timers of many employees in one transaction.
+
+        :param employee_ids: ids of the employees whose timers are stopped.
+        :param stop_dt: moment the timers are stopped, now by default.
+        :return: list of dicts with the ``employee_id`` and the
+            ``stopped_line_ids`` of each employee, empty if no timer was running.
+        """
+        end = fields.Datetime.to_datetime(stop_dt or datetime.now())
+        employees = self.env["hr.employee"].browse(employee_ids)
+        timer_model = self.env["hr.timesheet.running.timer"]
+        timer_model._lock_employees(employees.ids)
+        running = timer_model._get_running_lines(employees)
+        running._stop_timers(end)
+        line_ids_per_employee = defaultdict(list)
+        for line in running:
+            line_ids_per_employee[line.employee_id.id].append(line.id)
+        return [
+            {
+                "employee_id": employee_id,
+                "stopped_line_ids": line_ids_per_employee[employee_id],
+            }
+            for employee_id in employees.ids
+        ]
+
+    @api.model
+    def _prepare_timer_event_values(self, event):
+        """Return the values of the line started by an offline ``start`` event."""
+        return {
+            "timer_uuid": event["timer_uuid"],
+            "date_time": fields.Datetime.to_datetime(event["timestamp"]),
+            "employee_id": event.get("employee_id") or self.env.user.employee_id.id,
+            "project_id": event.get("project_id"),
+            "task_id": event.get("task_id") or False,
+            "name": event.get("name") or "/",
+            "unit_amount": 0,
+        }
+
+    @api.model
+    def sync_timer_events(self, events):
+        """Apply a batch of timer events recorded offline by a client.
+
+        Events are applied in the order of their timestamps and identified by
+        the ``timer_uuid`` of their timer, so sending the same batch again
+        changes nothing. Like a switch, starting a timer stops the timers of the
+        employee running at that moment.
+
+        :param events: list of dicts with the ``timer_uuid``, the ``type`` of the
+            event (``start`` or ``stop``) and its ``timestamp``. ``start`` events
+            also give the ``project_id``, and optionally the ``task_id``, the
+            ``name`` and the ``employee_id``, the one of the user by default.
+        :return: list with, for each event, a dict with its ``timer_uuid``, its
+            ``type``, the ``line_id`` of its timer and a ``status``: ``applied``,
+            ``duplicate`` if it was already synchronized or its timer already
+            stopped, ``unknown`` for a stop event of a timer never started, or
+            ``invalid`` for a stop event earlier than the start of its timer.
+        """
+        timer_uuids = list({event["timer_uuid"] for event in events})
+        lines = self.search_fetch(
+            [("timer_uuid", "in", timer_uuids)],
+            ["date_time", "employee_id", "timer_uuid", "unit_amount"],
+        )
+        line_per_uuid = {line.timer_uuid: line for line in lines}
+        # Replay the events in chronological order, starts before stops
+        order = sorted(
+            range(len(events)),
+            key=lambda index: (
+                fields.Datetime.to_datetime(events[index]["timestamp"]),
+                events[index]["type"] == "stop",
+            ),
+        )
+        start_values = {}
+        for index in order:
+            event = events[index]
+            timer_uuid = event["timer_uuid"]
+            if event["type"] == "start" and timer_uuid not in line_per_uuid:
+                start_values.setdefault(
+                    timer_uuid, self._prepare_timer_event_values(event)
+                )
+        employees = self.env["hr.employee"].browse(
+            {values["employee_id"] for values in start_values.values()}
+        )
+        timer_model = self.env["hr.timesheet.running.timer"]
+        timer_model._lock_employees((employees | lines.employee_id).ids)
+        # Timers are the ids of existing lines and the uuids of the new ones
+        timer_start = {}
+        timer_employee = {}
+        running = defaultdict(set)
+        running_lines = timer_model._get_running_lines(employees) | lines.filtered(
+            lambda line: not line.unit_amount
+        )
+        for line in running_lines:
+            timer_start[line.id] = line.date_time
+            timer_employee[line.id] = line.employee_id.id
+            running[line.employee_id.id].add(line.id)
+        # Known upfront, so that stops sorted before their start are rejected
+        for timer_uuid, values in start_values.items():
+            timer_start[timer_uuid] = values["date_time"]
+            timer_employee[timer_uuid] = values["employee_id"]
+        started = set()
+        end_per_timer = {}
+        statuses = [None] * len(events)
+        for index in order:
+            event = events[index]
+            timer_uuid = event["timer_uuid"]
+            moment = fields.Datetime.to_datetime(event["timestamp"])
+            line = line_per_uuid.get(timer_uuid)
+            if event["type"] == "start":
+                if line or timer_uuid in started:
+                    statuses[index] = "duplicate"
+                    continue
+                started.add(timer_uuid)
+                employee_id = timer_employee[timer_uuid]
+                # Like a switch, stop the timers running at that moment
+                later_starts = []
+                for timer in list(running[employee_id]):
+                    if timer_start[timer] <= moment:
+                        end_per_timer[timer] = moment
+                        running[employee_id].discard(timer)
+                    else:
+                        later_starts.append(timer_start[timer])
+                if later_starts:
+                    # A timer started afterwards already replaced this one
+                    end_per_timer[timer_uuid] = min(later_starts)
+                else:
+                    running[employee_id].add(timer_uuid)
+                statuses[index] = "applied"
+                continue
+            timer = line.id if line else timer_uuid
+            if timer in end_per_timer or (line and line.unit_amount):
+                statuses[index] = "duplicate"
+            elif timer not in timer_start:
+                statuses[index] = "unknown"
+            elif moment < timer_start[timer]:
+                statuses[index] = "invalid"
+            else:
+                end_per_timer[timer] = moment
+                running[timer_employee[timer]].discard(timer)
+                statuses[index] = "applied"
+        new_lines = self.create(list(start_values.values()))
+        line_per_uuid.update(zip(start_values, new_lines, strict=True))
+        # Stop the timers all at once, refreshing the running timers once
+        end_per_line = {
+            line_per_uuid[timer] if isinstance(timer, str) else self.browse(timer): end
+            for timer, end in end_per_timer.items()
+        }
+        self.browse([line.id for line in end_per_line])._set_timer_durations(
+            {
+                line.id: line._duration(line.date_time, end)
+                for line, end in end_per_line.items()
+            }
+        )
+        return [
+            {
+                "timer_uuid": event["timer_uuid"],
+                "type": event["type"],
+                "line_id": line_per_uuid.get(event["timer_uuid"], self).id,
+                "status": status,
+            }
+            for event, status in zip(events, statuses, strict=True)
+        ]
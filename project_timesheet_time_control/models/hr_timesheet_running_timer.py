@@ -0,0 +1,192 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import api, fields, models
+
+
+class HrTimesheetRunningTimer(models.Model):
+    _name = "hr.timesheet.running.timer"
+    _description = "Running timesheet timer of an employee"
+    _rec_name = "employee_id"
+    _sql_constraints = [
+        (
+            "employee_uniq",
+            "UNIQUE(employee_id)",
+            "There can only be one running timer record per employee",
+        ),
+    ]
+
+    employee_id = fields.Many2one(
+        comodel_name="hr.employee",
+        string="Employee",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+    )
+    line_id = fields.Many2one(
+        comodel_name="account.analytic.line",
+        string="Running Line",
+        required=True,
+        readonly=True,
+        ondelete="cascade",
+        help="Most recently started running timesheet line of the employee.",
+    )
+    line_count = fields.Integer(
+        string="# Running Lines",
+        readonly=True,
+        help="Running timesheet lines of the employee. More than one means the "
+        "timer to stop is ambiguous.",
+    )
+
+    @api.model
+    def _lock_employees(self, employee_ids):
+        """Serialize the timer changes of these employees until the transaction ends.
+
+        Starts and stops of the same employee, such as from two browser tabs,
+        wait for each other instead of both acting on the same running timers.
+        As the snapshot of the waiting transaction predates the changes of the
+        first one, the rows of the employees are updated and not only locked:
+        once the first transaction commits, the waiting one fails with a
+        serialization error, and is retried on up-to-date running timers.
+        Rows are locked in employee order to prevent deadlocks between batches.
+        """
+        employee_ids = sorted(set(employee_ids))
+        if not employee_ids:
+            return
+        # The row of the employee, as employees without a running timer have
+        # no timer row to conflict on
+        self.env.cr.execute(
+            """
+            UPDATE hr_employee SET write_date = write_date
+            WHERE id IN (
+                SELECT id FROM hr_employee
+                WHERE id = ANY(%s)
+                ORDER BY id
+                FOR NO KEY UPDATE
+            )
+            """,
+            [employee_ids],
+        )
+
+    @api.model
+    def _refresh_employees(self, employee_ids):
+        """Bring the running timers of the given employees up to date."""
+        employee_ids = list(employee_ids)
+        if not employee_ids:
+            return
+        self.env["account.analytic.line"].flush_model(
+            ["date_time", "employee_id", "project_id", "unit_amount"]
+        )
+        # Served by the partial index on running timesheet lines
+        self.env.cr.execute(
+            """
+            SELECT employee_id,
+                (ARRAY_AGG(id ORDER BY date_time DESC, id DESC))[1],
+                COUNT(*)
+            FROM account_analytic_line
+            WHERE date_time IS NOT NULL
+                AND unit_amount = 0
+                AND project_id IS NOT NULL
+                AND employee_id = ANY(%s)
+            GROUP BY employee_id
+            """,
+            [employee_ids],
+        )
+        values = {
+            employee_id: {"line_id": line_id, "line_count": line_count}
+            for employee_id, line_id, line_count in self.env.cr.fetchall()
+        }
+        timer_model = self.sudo()
+        timers = timer_model.search([("employee_id", "in", employee_ids)])
+        stopped = timers.filtered(lambda timer: timer.employee_id.id not in values)
+        events = [timer._prepare_bus_event(running=False) for timer in stopped]
+        stopped.unlink()
+        switched = timer_model
+        for timer in timers - stopped:
+            timer_values = values.pop(timer.employee_id.id)
+            if timer.line_id.id != timer_values["line_id"]:
+                switched |= timer
+            if (
+                timer.line_id.id != timer_values["line_id"]
+                or timer.line_count != timer_values["line_count"]
+            ):
+                timer.write(timer_values)
+        started = timer_model.create(
+            [
+                dict(timer_values, employee_id=employee_id)
+                for employee_id, timer_values in values.items()
+            ]
+        )
+        events += [
+            timer._prepare_bus_event(running=True) for timer in switched | started
+        ]
+        if events:
+            self.env["bus.bus"].sudo()._sendmany(events)
+        # The time controls of tasks and projects only change with the timers
+        self.env["res.users"].invalidate_model(["running_timesheet_line_ids"])
+        self.env["project.project"].invalidate_model(["show_time_control"])
+        self.env["project.task"].invalidate_model(["show_time_control"])
+
+    def _prepare_bus_event(self, running):
+        """Return the bus notification telling the current timer of the employee.
+
+        Live dashboards listen to it on the ``timesheet_timer`` channel of the
+        company of the employee.
+        """
+        self.ensure_one()
+        line = self.line_id
+        return (
+            (self.employee_id.company_id, "timesheet_timer"),
+            "project_timesheet_time_control/timer",
+            {
+                "running": running,
+                "employee_id": [self.employee_id.id, self.employee_id.display_name],
+                "line_id": line.id,
+                "project_id": [line.project_id.id, line.project_id.display_name]
+                if line.project_id
+                else False,
+                "task_id": [line.task_id.id, line.task_id.display_name]
+                if line.task_id
+                else False,
+                "date_time": fields.Datetime.to_string(line.date_time),
+            },
+        )
+
+    @api.model
+    def _rebuild(self):
+        """Rebuild the running timers of all employees."""
+        self.env.flush_all()
+        self.env.cr.execute(
+            """
+            SELECT DISTINCT employee_id
+            FROM account_analytic_line
+            WHERE date_time IS NOT NULL
+                AND unit_amount = 0
+                AND employee_id IS NOT NULL
+            UNION
+            SELECT employee_id FROM hr_timesheet_running_timer
+            """
+        )
+        self._refresh_employees(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def _get_running_lines(self, employees):
+        """Return the running timesheet lines of ``employees``.
+
+        Employees with a single running line, the usual case, are served by
+        their timer record only.
+        """
+        timers = self.sudo().search([("employee_id", "in", employees.ids)])
+        line_model = self.env["account.analytic.line"]
+        single = timers.filtered(lambda timer: timer.line_count == 1)
+        lines = line_model.browse(single.line_id.ids)
+        ambiguous = timers - single
+        if ambiguous:
+            lines |= line_model.search(
+                [
+                    ("date_time", "!=", False),
+                    ("employee_id", "in", ambiguous.employee_id.ids),
+                    ("project_id", "!=", False),
+                    ("unit_amount", "=", 0),
+                ]
+            )
+        return lines
@@ -1,6 +1,8 @@
 # Copyright 2019 Tecnativa - Jairo Llopis
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from collections import Counter
+
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 
@@ -27,22 +29,27 @@ class HrTimesheetTimeControlMixin(models.AbstractModel):
             (self._relation_with_timesheet_line(), "in", self.ids),
         ]
 
+    def _get_running_timesheet_lines(self):
+        """Running timesheet lines of the current user related to the records."""
+        related_field = self._relation_with_timesheet_line()
+        # Shared by all the records of the transaction
+        lines = self.env.user.running_timesheet_line_ids.with_env(self.env)
+        return lines.filtered(
+            lambda line: (
+                line.project_id.allow_timesheets and line[related_field] in self
+            )
+        )
+
     def _compute_show_time_control(self):
         """Decide which time control button to show, if any."""
         related_field = self._relation_with_timesheet_line()
-        grouped = self.env["account.analytic.line"].read_group(
-            domain=self._timesheet_running_domain(),
-            fields=["id"],
-            groupby=[related_field],
+        lines_per_record = Counter(
+            line[related_field].id for line in self._get_running_timesheet_lines()
         )
-        lines_per_record = {
-            group[related_field][0]: group["%s_count" % related_field]
-            for group in grouped
-        }
         button_per_lines = {0: "start", 1: "stop"}
         for record in self:
             record.show_time_control = button_per_lines.get(
-                lines_per_record.get(record.id, 0),
+                lines_per_record[record.id],
                 False,
             )
 
@@ -60,9 +67,7 @@ class HrTimesheetTimeControlMixin(models.AbstractModel):
         }
 
     def button_end_work(self):
-        running_lines = self.env["account.analytic.line"].search(
-            self._timesheet_running_domain(),
-        )
+        running_lines = self._get_running_timesheet_lines()
         if not running_lines:
             model = self.env["ir.model"].sudo().search([("model", "=", self._name)])
             message = _(
@@ -0,0 +1,17 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import models
+
+
+class IrWebsocket(models.AbstractModel):
+    _inherit = "ir.websocket"
+
+    def _build_bus_channel_list(self, channels):
+        # Timesheet approvers follow the timers of their companies
+        if self.env.uid and self.env.user.has_group(
+            "hr_timesheet.group_hr_timesheet_approver"
+        ):
+            channels = list(channels) + [
+                (company, "timesheet_timer") for company in self.env.user.company_ids
+            ]
+        return super()._build_bus_channel_list(channels)
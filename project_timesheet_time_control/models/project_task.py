@@ -12,11 +12,7 @@ class ProjectTask(models.Model):
     def _relation_with_timesheet_line(self):
         return "task_id"
 
-    @api.depends(
-        "project_id.allow_timesheets",
-        "timesheet_ids.employee_id",
-        "timesheet_ids.unit_amount",
-    )
+    @api.depends("project_id.allow_timesheets")
     def _compute_show_time_control(self):
         result = super()._compute_show_time_control()
         for task in self:
@@ -0,0 +1,21 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import fields, models
+
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = "res.config.settings"
+
+    timesheet_auto_stop_max_hours = fields.Float(
+        string="Auto-stop Timers After",
+        config_parameter="project_timesheet_time_control.auto_stop_max_hours",
+        help="Hours after which a forgotten running timer is stopped by the "
+        "scheduled action. Leave empty to never stop timers automatically.",
+    )
+    timesheet_auto_stop_working_schedule = fields.Boolean(
+        string="Stop at the End of the Working Day",
+        config_parameter="project_timesheet_time_control.auto_stop_working_schedule",
+        help="Stop forgotten timers at the end of the working day of their "
+        "employee, according to the working schedule, instead of after the "
+        "maximum duration.",
+    )
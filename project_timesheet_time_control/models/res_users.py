@@ -0,0 +1,22 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import fields, models
+
+
+class ResUsers(models.Model):
+    _inherit = "res.users"
+
+    running_timesheet_line_ids = fields.Many2many(
+        comodel_name="account.analytic.line",
+        string="Running Timesheet Lines",
+        compute="_compute_running_timesheet_line_ids",
+        help="Running timesheet lines of the employees of the user. Computed once "
+        "per transaction, until a running timer changes.",
+    )
+
+    def _compute_running_timesheet_line_ids(self):
+        timer_model = self.env["hr.timesheet.running.timer"]
+        for user in self:
+            user.running_timesheet_line_ids = timer_model._get_running_lines(
+                user.employee_ids
+            )
@@ -0,0 +1,63 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+from odoo import fields, models, tools
+
+
+class HrTimesheetOverlapReport(models.Model):
+    _name = "hr.timesheet.overlap.report"
+    _description = "Overlapping timesheet entries"
+    _auto = False
+    _order = "overlap_start desc, line_id, overlapping_line_id"
+
+    employee_id = fields.Many2one(
+        comodel_name="hr.employee", string="Employee", readonly=True
+    )
+    company_id = fields.Many2one(
+        comodel_name="res.company", string="Company", readonly=True
+    )
+    line_id = fields.Many2one(
+        comodel_name="account.analytic.line", string="Timesheet Line", readonly=True
+    )
+    overlapping_line_id = fields.Many2one(
+        comodel_name="account.analytic.line",
+        string="Overlapping Line",
+        readonly=True,
+    )
+    overlap_start = fields.Datetime(readonly=True)
+    overlap_end = fields.Datetime(readonly=True)
+    overlap_duration = fields.Float(string="Overlap (Hours)", readonly=True)
+
+    def init(self):
+        # Each pair of overlapping lines of an employee is found through the
+        # range index on the timesheet lines, in a single pass. The id encodes
+        # the pair, so it is stable and filters on the lines reach the join.
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(
+            f"""
+            CREATE OR REPLACE VIEW {self._table} AS (
+                SELECT
+                    (line.id::bigint << 31) | other.id AS id,
+                    line.employee_id,
+                    line.company_id,
+                    line.id AS line_id,
+                    other.id AS overlapping_line_id,
+                    GREATEST(line.date_time, other.date_time) AS overlap_start,
+                    LEAST(line.date_time_end, other.date_time_end) AS overlap_end,
+                    EXTRACT(
+                        EPOCH FROM LEAST(line.date_time_end, other.date_time_end)
+                        - GREATEST(line.date_time, other.date_time)
+                    ) / 3600 AS overlap_duration
+                FROM account_analytic_line AS line
+                JOIN account_analytic_line AS other
+                    ON other.employee_id = line.employee_id
+                    AND other.id > line.id
+                    AND other.project_id IS NOT NULL
+                    AND other.date_time_end >= other.date_time
+                    AND tsrange(other.date_time, other.date_time_end)
+                        && tsrange(line.date_time, line.date_time_end)
+                WHERE line.employee_id IS NOT NULL
+                    AND line.project_id IS NOT NULL
+                    AND line.date_time_end >= line.date_time
+            )
+            """
+        )
@@ -1,3 +1,4 @@
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0
 
 from . import test_project_timesheet_time_control
+from . import test_project_timesheet_time_control_benchmark
@@ -1,9 +1,12 @@
 # Copyright 2016-2018 Tecnativa - Pedro M. Baeza
 # License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0
 
+import json
 from datetime import date, datetime, timedelta
 
-from odoo import exceptions
+import psycopg2
+
+from odoo import exceptions, fields
 from odoo.tests import Form, common
 from odoo.tools.float_utils import float_compare
 
@@ -278,3 +281,476 @@ class TestProjectTimesheetTimeControl(common.TransactionCase):
         )
         line.unit_amount = 500.0
         self.assertFalse(line.date_time_end)
+
+    def _explain(self, query, params):
+        """Return the plan of ``query`` when sequential scans are avoided."""
+        self.env.cr.execute("SET LOCAL enable_seqscan = off")
+        try:
+            self.env.cr.execute(f"EXPLAIN {query}", params)
+            return "\n".join(row[0] for row in self.env.cr.fetchall())
+        finally:
+            self.env.cr.execute("RESET enable_seqscan")
+
+    def test_running_timer_index(self):
+        """Running timer lookups are served by the partial indexes."""
+        for field_name, value in (
+            ("employee_id", self.line.employee_id.id),
+            ("user_id", self.line.user_id.id),
+        ):
+            plan = self._explain(
+                f"""
+                SELECT id FROM account_analytic_line
+                WHERE date_time IS NOT NULL AND unit_amount = 0
+                    AND {field_name} = %s
+                """,
+                [value],
+            )
+            self.assertIn(f"account_analytic_line_running_{field_name}_index", plan)
+
+    def test_running_timer_registry(self):
+        """Running timers are registered per employee."""
+        timer_model = self.env["hr.timesheet.running.timer"]
+        employee = self.line.employee_id
+        timer = timer_model.search([("employee_id", "=", employee.id)])
+        self.assertEqual(timer.line_id, self.line)
+        self.assertEqual(timer.line_count, 1)
+        other_line = self.line.copy(
+            {"date_time": datetime.now() - timedelta(minutes=30)}
+        )
+        self.assertEqual(timer.line_id, other_line)
+        self.assertEqual(timer.line_count, 2)
+        self.assertEqual(
+            timer_model._get_running_lines(employee), self.line | other_line
+        )
+        other_line.button_end_work()
+        self.assertEqual(timer.line_id, self.line)
+        self.assertEqual(timer.line_count, 1)
+        self.line.button_end_work()
+        self.assertFalse(timer.exists())
+        self.assertFalse(timer_model._get_running_lines(employee))
+        # Lines changed to running ones are registered too
+        other_line.unit_amount = 0
+        timer = timer_model.search([("employee_id", "=", employee.id)])
+        self.assertEqual(timer.line_id, other_line)
+        other_line.unlink()
+        self.assertFalse(timer.exists())
+        # The registry can be rebuilt from the timesheet lines
+        running_line = self.line.copy({})
+        timer_model.search([]).unlink()
+        timer_model._rebuild()
+        self.assertEqual(timer_model._get_running_lines(employee), running_line)
+
+    def test_show_time_control_shared_lookup(self):
+        """Tasks and projects share one running timer lookup per transaction."""
+        tasks = self.task | self.env["project.task"].create(
+            [
+                {"name": f"Other task {index}", "project_id": self.project.id}
+                for index in range(3)
+            ]
+        )
+        self.env.invalidate_all()
+        self.assertEqual(
+            tasks.mapped("show_time_control"), ["stop", "start", "start", "start"]
+        )
+        queries_before = self.env.cr.sql_log_count
+        self.assertEqual(self.project.show_time_control, "stop")
+        self.assertEqual(self.env.cr.sql_log_count, queries_before)
+        # Timesheet changes unrelated to running timers keep the lookup
+        self.env["account.analytic.line"].create(
+            {
+                "date_time": datetime.now() - timedelta(hours=3),
+                "unit_amount": 1,
+                "task_id": tasks[1].id,
+                "project_id": self.project.id,
+                "name": "Finished line",
+            }
+        )
+        self.assertEqual(tasks[1].show_time_control, "start")
+        # Stopping the timer updates the time controls
+        self.line.button_end_work()
+        self.assertEqual(self.task.show_time_control, "start")
+        self.assertEqual(self.project.show_time_control, "start")
+
+    def test_batch_switch_and_stop(self):
+        """Timers of several employees are switched and stopped at once."""
+        employee = self.line.employee_id
+        start = self.line.date_time + timedelta(hours=2)
+        results = self.env["hr.timesheet.switch"].switch_employee_timers(
+            [
+                {
+                    "employee_id": employee.id,
+                    "name": "Batch 1",
+                    "project_id": self.project.id,
+                    "date_time": start,
+                },
+                {
+                    "employee_id": self.other_employee.id,
+                    "name": "Batch 2",
+                    "project_id": self.project.id,
+                    "task_id": self.task.id,
+                    "date_time": start,
+                },
+            ]
+        )
+        self.assertEqual(
+            [(result["employee_id"], result["stopped_line_ids"]) for result in results],
+            [(employee.id, self.line.ids), (self.other_employee.id, [])],
+        )
+        self.assertEqual(self.line.unit_amount, 2)
+        new_lines = self.env["account.analytic.line"].browse(
+            [result["started_line_id"] for result in results]
+        )
+        self.assertEqual(new_lines.employee_id, employee | self.other_employee)
+        self.assertEqual(new_lines.mapped("date_time"), [start, start])
+        self.assertEqual(new_lines.mapped("unit_amount"), [0, 0])
+        results = self.env["account.analytic.line"].stop_employee_timers(
+            (employee | self.other_employee).ids, stop_dt=start + timedelta(hours=1)
+        )
+        self.assertEqual(
+            [result["stopped_line_ids"] for result in results],
+            [new_lines[0].ids, new_lines[1].ids],
+        )
+        self.assertEqual(new_lines.mapped("unit_amount"), [1, 1])
+        self.assertFalse(
+            self.env["hr.timesheet.running.timer"].search(
+                [("employee_id", "in", new_lines.employee_id.ids)]
+            )
+        )
+        # Each employee starts exactly one timer
+        switch_model = self.env["hr.timesheet.switch"]
+        with self.assertRaises(exceptions.UserError):
+            switch_model.switch_employee_timers(
+                [
+                    {"employee_id": employee.id, "project_id": self.project.id},
+                    {"employee_id": employee.id, "project_id": self.project.id},
+                ]
+            )
+        with self.assertRaises(exceptions.UserError):
+            switch_model.switch_employee_timers([{"project_id": self.project.id}])
+        # Timers cannot be stopped before they started
+        running = new_lines[0].copy({})
+        with self.assertRaises(exceptions.UserError):
+            switch_model.switch_employee_timers(
+                [
+                    {
+                        "employee_id": employee.id,
+                        "project_id": self.project.id,
+                        "date_time": running.date_time - timedelta(minutes=5),
+                    }
+                ]
+            )
+        with self.assertRaises(exceptions.UserError):
+            self.env["account.analytic.line"].stop_employee_timers(
+                employee.ids, stop_dt=running.date_time - timedelta(minutes=5)
+            )
+        self.assertEqual(running.unit_amount, 0)
+
+    def test_sync_timer_events(self):
+        """Offline timer events are applied once, whatever the resends."""
+        self.line.button_end_work()
+        start = datetime(2024, 5, 6, 8, 0, 0)
+        events = [
+            {
+                "timer_uuid": "offline-1",
+                "type": "start",
+                "timestamp": fields.Datetime.to_string(start),
+                "project_id": self.project.id,
+                "task_id": self.task.id,
+                "name": "Offline work",
+            },
+            {
+                "timer_uuid": "offline-1",
+                "type": "stop",
+                "timestamp": fields.Datetime.to_string(start + timedelta(hours=2)),
+            },
+            {
+                "timer_uuid": "offline-2",
+                "type": "start",
+                "timestamp": fields.Datetime.to_string(start + timedelta(hours=3)),
+                "project_id": self.project.id,
+            },
+            {
+                "timer_uuid": "unknown",
+                "type": "stop",
+                "timestamp": fields.Datetime.to_string(start + timedelta(hours=4)),
+            },
+        ]
+        line_model = self.env["account.analytic.line"]
+        results = line_model.sync_timer_events(events)
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["applied", "applied", "applied", "unknown"],
+        )
+        stopped, running = line_model.browse(
+            [results[0]["line_id"], results[2]["line_id"]]
+        )
+        self.assertEqual(results[1]["line_id"], stopped.id)
+        self.assertFalse(results[3]["line_id"])
+        self.assertEqual(stopped.date_time, start)
+        self.assertEqual(stopped.date, date(2024, 5, 6))
+        self.assertEqual(stopped.unit_amount, 2)
+        self.assertEqual(stopped.task_id, self.task)
+        self.assertEqual(running.unit_amount, 0)
+        self.assertEqual(running.employee_id, self.env.user.employee_id)
+        self.assertEqual(
+            self.env["hr.timesheet.running.timer"]
+            .search([("employee_id", "=", running.employee_id.id)])
+            .line_id,
+            running,
+        )
+        # Sending the batch again changes nothing
+        results = line_model.sync_timer_events(events)
+        self.assertEqual(
+            [result["status"] for result in results],
+            ["duplicate", "duplicate", "duplicate", "unknown"],
+        )
+        self.assertEqual(
+            line_model.search_count([("timer_uuid", "in", ["offline-1", "offline-2"])]),
+            2,
+        )
+
+    def test_auto_stop_timers(self):
+        """Forgotten timers are capped by the scheduled action."""
+        line_model = self.env["account.analytic.line"]
+        param_model = self.env["ir.config_parameter"]
+        employee = self.line.employee_id
+        employee.write(
+            {
+                "resource_calendar_id": self.env.ref(
+                    "resource.resource_calendar_std"
+                ).id,
+                "tz": "Europe/Brussels",
+            }
+        )
+        # Monday 8:00 in Brussels
+        forgotten = self.line.copy(
+            {"date_time": datetime(2024, 5, 6, 6, 0, 0), "unit_amount": 0}
+        )
+        line_model._cron_auto_stop_timers()
+        self.assertEqual(forgotten.unit_amount, 0)
+        param_model.set_param("project_timesheet_time_control.auto_stop_max_hours", 10)
+        line_model._cron_auto_stop_timers()
+        self.assertEqual(forgotten.unit_amount, 10)
+        self.assertEqual(self.line.unit_amount, 0)
+        # Capped at 17:00, the end of the working day, with the working periods
+        # of both employees computed together
+        forgotten.unit_amount = 0
+        self.other_employee.write(
+            {"resource_calendar_id": employee.resource_calendar_id.id, "tz": "UTC"}
+        )
+        other_forgotten = forgotten.copy(
+            {
+                "date_time": datetime(2024, 5, 6, 14, 0, 0),
+                "employee_id": self.other_employee.id,
+                "unit_amount": 0,
+            }
+        )
+        param_model.set_param(
+            "project_timesheet_time_control.auto_stop_working_schedule", True
+        )
+        calendar_class = type(employee.resource_calendar_id)
+        work_intervals_batch = calendar_class._work_intervals_batch
+        calendars = []
+
+        def counting_work_intervals_batch(calendar, *args, **kwargs):
+            calendars.append(calendar)
+            return work_intervals_batch(calendar, *args, **kwargs)
+
+        self.patch(
+            calendar_class, "_work_intervals_batch", counting_work_intervals_batch
+        )
+        line_model._cron_auto_stop_timers()
+        self.assertEqual(forgotten.unit_amount, 9)
+        self.assertEqual(other_forgotten.unit_amount, 3)
+        self.assertEqual(len(calendars), 1)
+        self.assertEqual(
+            self.env["hr.timesheet.running.timer"]
+            .search([("employee_id", "=", employee.id)])
+            .line_id,
+            self.line,
+        )
+
+    def test_sync_timer_events_running_timer(self):
+        """Offline starts stop the running timer, and stops keep after starts."""
+        line_model = self.env["account.analytic.line"]
+        start = self.line.date_time + timedelta(minutes=30)
+        results = line_model.sync_timer_events(
+            [
+                {
+                    "timer_uuid": "offline-1",
+                    "type": "start",
+                    "timestamp": fields.Datetime.to_string(start),
+                    "project_id": self.project.id,
+                },
+                {
+                    "timer_uuid": "offline-1",
+                    "type": "stop",
+                    "timestamp": fields.Datetime.to_string(
+                        start - timedelta(minutes=10)
+                    ),
+                },
+            ]
+        )
+        self.assertEqual(
+            [result["status"] for result in results], ["applied", "invalid"]
+        )
+        self.assertEqual(self.line.unit_amount, 0.5)
+        running = line_model.browse(results[0]["line_id"])
+        self.assertEqual(running.unit_amount, 0)
+        self.assertEqual(line_model.search(line_model._running_domain()), running)
+
+    def _unlink_committed_employee(self, employee_id):
+        with self.registry.cursor() as cr:
+            self.env(cr=cr, su=True)["hr.employee"].browse(employee_id).unlink()
+
+    def test_timer_employee_lock(self):
+        """Concurrent timer changes of an employee fail with a retryable error."""
+        # Committed, so that the other transactions see it
+        with self.registry.cursor() as cr:
+            employee_id = (
+                self.env(cr=cr, su=True)["hr.employee"].create({"name": "Kiosk"}).id
+            )
+        self.addCleanup(self._unlink_committed_employee, employee_id)
+        with self.registry.cursor() as cr1, self.registry.cursor() as cr2:
+            timer1 = self.env(cr=cr1, su=True)["hr.timesheet.running.timer"]
+            timer2 = self.env(cr=cr2, su=True)["hr.timesheet.running.timer"]
+            # Both transactions take their snapshot before the first commits
+            cr1.execute("SELECT 1")
+            cr2.execute("SELECT 1")
+            timer1._lock_employees([employee_id])
+            cr1.commit()
+            with self.assertRaises(psycopg2.errors.SerializationFailure):
+                timer2._lock_employees([employee_id])
+            # Retried with a new snapshot, the second transaction goes on
+            cr2.rollback()
+            timer2._lock_employees([employee_id])
+
+    def test_switch_stale_wizard(self):
+        """Switching stops the timer running now, not when the wizard opened."""
+        line_model = self.env["account.analytic.line"]
+        wizard = self._create_wizard(self.line.button_resume_work(), self.line)
+        self.assertEqual(wizard.running_timer_id, self.line)
+        # The timer is switched from another browser tab meanwhile
+        other_tab = self._create_wizard(self.line.button_resume_work(), self.line)
+        other_tab.action_switch()
+        running = line_model.search(line_model._running_domain())
+        self.assertNotEqual(running, self.line)
+        wizard.date_time = running.date_time
+        wizard.action_switch()
+        self.assertTrue(running.unit_amount)
+        self.assertEqual(line_model.search_count(line_model._running_domain()), 1)
+
+    def test_end_time_multiple_days(self):
+        """End times spanning several days keep their whole duration."""
+        line = self.line.copy({"name": "Long line"})
+        line.date_time = datetime(2020, 8, 1, 10, 0, 0)
+        line.date_time_end = datetime(2020, 8, 3, 12, 0, 0)
+        self.assertFalse(float_compare(line.unit_amount, 50.0, precision_digits=2))
+        line.invalidate_recordset(["date_time_end"])
+        self.assertEqual(line.date_time_end, datetime(2020, 8, 3, 12, 0, 0))
+
+    def test_overlap_report(self):
+        """Overlapping entries of an employee are reported in pairs."""
+        self.line.button_end_work()
+        line_model = self.env["account.analytic.line"]
+        values = {
+            "project_id": self.project.id,
+            "employee_id": self.line.employee_id.id,
+            "name": "Overlap",
+        }
+        first = line_model.create(
+            dict(values, date_time=datetime(2020, 8, 1, 8, 0, 0), unit_amount=3)
+        )
+        second = line_model.create(
+            dict(values, date_time=datetime(2020, 8, 1, 10, 0, 0), unit_amount=2)
+        )
+        # Adjacent entries do not overlap
+        line_model.create(
+            dict(values, date_time=datetime(2020, 8, 1, 12, 0, 0), unit_amount=1)
+        )
+        line_model.create(
+            dict(
+                values,
+                employee_id=self.other_employee.id,
+                date_time=datetime(2020, 8, 1, 9, 0, 0),
+                unit_amount=1,
+            )
+        )
+        self.assertEqual(
+            line_model.search(
+                [
+                    ("date_time_end", ">", datetime(2020, 8, 1, 10, 0, 0)),
+                    ("date_time", "<", datetime(2020, 8, 1, 11, 0, 0)),
+                    ("employee_id", "=", self.line.employee_id.id),
+                ]
+            ),
+            second | first,
+        )
+        self.env.flush_all()
+        report = self.env["hr.timesheet.overlap.report"].search(
+            [("line_id", "in", (first | second).ids)]
+        )
+        self.assertEqual(len(report), 1)
+        self.assertEqual(report.id, (first.id << 31) | second.id)
+        self.assertEqual(report.overlapping_line_id, second)
+        self.assertEqual(report.overlap_start, datetime(2020, 8, 1, 10, 0, 0))
+        self.assertEqual(report.overlap_end, datetime(2020, 8, 1, 11, 0, 0))
+        self.assertEqual(report.overlap_duration, 1)
+        # Entries of other companies are not reported
+        company = self.env["res.company"].create({"name": "Other company"})
+        self.env.user.company_ids |= company
+        self.assertFalse(
+            report.with_context(allowed_company_ids=company.ids).search(
+                [("line_id", "in", (first | second).ids)]
+            )
+        )
+
+    def test_timer_bus_events(self):
+        """Starting and stopping timers is published on the bus."""
+
+        def timer_messages():
+            return [
+                json.loads(bus.message)
+                for bus in self.env["bus.bus"].search(
+                    [("message", "like", "project_timesheet_time_control/timer")],
+                    order="id",
+                )
+            ]
+
+        self.env["bus.bus"].search([]).unlink()
+        self.line.button_end_work()
+        new_line = self.line.copy({"name": "Started"})
+        messages = timer_messages()
+        self.assertEqual(
+            [message["payload"]["running"] for message in messages], [False, True]
+        )
+        self.assertEqual(messages[0]["payload"]["line_id"], self.line.id)
+        payload = messages[1]["payload"]
+        self.assertEqual(payload["line_id"], new_line.id)
+        self.assertEqual(payload["employee_id"][0], new_line.employee_id.id)
+        self.assertEqual(payload["task_id"][0], self.task.id)
+        self.assertEqual(payload["project_id"][0], self.project.id)
+        self.assertEqual(
+            payload["date_time"], fields.Datetime.to_string(new_line.date_time)
+        )
+        # Project timers have no task
+        new_line.button_end_work()
+        project_line = new_line.copy({"name": "Project work", "task_id": False})
+        payload = timer_messages()[-1]["payload"]
+        self.assertEqual(payload["line_id"], project_line.id)
+        self.assertIs(payload["task_id"], False)
+        self.assertEqual(payload["project_id"][0], self.project.id)
+
+    def test_closest_suggestion_index(self):
+        """The last line of an employee per task is found through an index."""
+        plan = self._explain(
+            """
+            SELECT id FROM account_analytic_line
+            WHERE employee_id = %s AND task_id = %s
+            ORDER BY date_time DESC
+            LIMIT 1
+            """,
+            [self.line.employee_id.id, self.task.id],
+        )
+        self.assertIn("account_analytic_line_employee_task_date_time_index", plan)
+        self.assertNotIn("Sort", plan)
@@ -0,0 +1,289 @@
+# License AGPL-3 - See http://www.gnu.org/licenses/agpl-3.0.html
+
+import logging
+import random
+import time
+from datetime import datetime, timedelta
+
+from odoo import fields
+from odoo.tests import common
+
+_logger = logging.getLogger(__name__)
+
+
+class TestProjectTimesheetTimeControlBenchmark(common.TransactionCase):
+    """Measure the time controls on batches of timesheet lines."""
+
+    line_count = 2000
+    max_duration = 2.0
+    max_import_duration = 30.0
+
+    def test_benchmark_date_time_end(self):
+        hour_uom = self.env.ref("uom.product_uom_hour")
+        start = datetime(2020, 1, 1, 8, 0, 0)
+        values = [
+            (start + timedelta(hours=index), (index % 40) / 4)
+            for index in range(self.line_count)
+        ]
+        line_model = self.env["account.analytic.line"]
+        lines = line_model.concat(
+            *(
+                line_model.new(
+                    {
+                        "date_time": date_time,
+                        "unit_amount": amount,
+                        "product_uom_id": hour_uom.id,
+                    }
+                )
+                for date_time, amount in values
+            )
+        )
+        environment_class = type(self.env)
+        ref = environment_class.ref
+        hour_uom_refs = []
+
+        def counting_ref(env, xml_id, *args, **kwargs):
+            if xml_id == "uom.product_uom_hour":
+                hour_uom_refs.append(xml_id)
+            return ref(env, xml_id, *args, **kwargs)
+
+        self.patch(environment_class, "ref", counting_ref)
+        started = time.perf_counter()
+        lines._compute_date_time_end()
+        duration = time.perf_counter() - started
+        _logger.info("_compute_date_time_end: %d lines in %.3fs", len(lines), duration)
+        self.assertLessEqual(duration, self.max_duration)
+        # The hour unit of measure is resolved once for the whole batch
+        self.assertEqual(len(hour_uom_refs), 1)
+        for line, (date_time, amount) in zip(lines, values, strict=True):
+            if amount:
+                self.assertEqual(
+                    line.date_time_end, date_time + timedelta(hours=amount)
+                )
+
+    def test_benchmark_eval_dates(self):
+        project = self.env["project.project"].create(
+            {"name": "Dates project", "allow_timesheets": True}
+        )
+        line_model = self.env["account.analytic.line"].with_context(
+            tz="Europe/Brussels"
+        )
+        start = datetime(2020, 1, 1, 0, 0, 0)
+        vals_list = [
+            {
+                "name": f"Dates {index}",
+                "project_id": project.id,
+                "date_time": fields.Datetime.to_string(
+                    start + timedelta(minutes=37 * index)
+                ),
+            }
+            for index in range(self.line_count)
+        ]
+        line_class = type(line_model)
+        get_date_tz = line_class._get_date_tz
+        tz_lookups = []
+
+        def counting_get_date_tz(model):
+            tz_lookups.append(model)
+            return get_date_tz(model)
+
+        self.patch(line_class, "_get_date_tz", counting_get_date_tz)
+        lines = line_model.create(vals_list)
+        # The timezone is resolved once for the whole batch
+        self.assertEqual(len(tz_lookups), 1)
+        self.assertEqual(
+            lines.mapped("date"),
+            [
+                fields.Date.context_today(
+                    line_model, fields.Datetime.from_string(vals["date_time"])
+                )
+                for vals in vals_list
+            ],
+        )
+
+    def test_benchmark_bulk_create(self):
+        project = self.env["project.project"].create(
+            {"name": "Import project", "allow_timesheets": True}
+        )
+        employee = self.env["hr.employee"].create({"name": "Badge employee"})
+        start = datetime(2020, 1, 1, 8, 0, 0)
+        vals_list = [
+            {
+                "name": f"Badge {index}",
+                "employee_id": employee.id,
+                "project_id": project.id,
+                "date_time": fields.Datetime.to_string(start + timedelta(hours=index)),
+                "unit_amount": 1,
+            }
+            for index in range(self.line_count)
+        ]
+        line_model = self.env["account.analytic.line"].with_context(
+            tracking_disable=True
+        )
+        started = time.perf_counter()
+        lines = line_model.create(vals_list)
+        self.env.flush_all()
+        duration = time.perf_counter() - started
+        _logger.info(
+            "create: %d lines in %.3fs, %.0f lines/s",
+            len(lines),
+            duration,
+            len(lines) / duration,
+        )
+        self.assertLessEqual(duration, self.max_import_duration)
+        self.assertEqual(
+            lines[-1].date, (start + timedelta(hours=self.line_count - 1)).date()
+        )
+
+
+class TestProjectTimesheetTimeControlLoad(common.TransactionCase):
+    """Check the timer operations of an employee against years of timesheets.
+
+    These operations run on every task and project form, so their query count
+    must not grow with the timesheet history. Each one is done once beforehand,
+    so that the checked run does not count the caches of the registry.
+    """
+
+    employee_count = 8
+    year_count = 1
+    lines_per_day = 2
+    project_count = 20
+    tasks_per_project = 10
+    seed = 42
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        admin = cls.env.ref("base.user_admin")
+        admin.groups_id |= cls.env.ref("hr_timesheet.group_hr_timesheet_user")
+        cls.env = cls.env(
+            user=admin, context=dict(cls.env.context, tracking_disable=True)
+        )
+        cls.employee = admin.employee_id
+        cls.employees = cls.employee | cls.env["hr.employee"].create(
+            [
+                {"name": f"Benchmark Employee {index}"}
+                for index in range(cls.employee_count - 1)
+            ]
+        )
+        cls.projects = cls.env["project.project"].create(
+            [
+                {"name": f"Benchmark Project {index}", "allow_timesheets": True}
+                for index in range(cls.project_count)
+            ]
+        )
+        cls.tasks = cls.env["project.task"].create(
+            [
+                {"name": f"Benchmark Task {index}", "project_id": project.id}
+                for project in cls.projects
+                for index in range(cls.tasks_per_project)
+            ]
+        )
+        cls._generate_timesheets(random.Random(cls.seed))
+        cls.env.flush_all()
+
+    @classmethod
+    def _generate_timesheets(cls, rng):
+        """Create the timesheets of the employees, each one with a running timer."""
+        start = datetime.now().replace(hour=8, minute=0, second=0, microsecond=0)
+        days = [
+            day
+            for day in (
+                start - timedelta(days=offset)
+                for offset in range(1, 365 * cls.year_count + 1)
+            )
+            if day.weekday() < 5
+        ]
+        values = []
+        for employee in cls.employees:
+            for day in days:
+                for index in range(cls.lines_per_day):
+                    task = rng.choice(cls.tasks)
+                    values.append(
+                        {
+                            "name": f"Benchmark work {index}",
+                            "employee_id": employee.id,
+                            "project_id": task.project_id.id,
+                            "task_id": rng.choice([task.id, False]),
+                            "date_time": day + timedelta(hours=4 * index),
+                            "unit_amount": rng.choice([0.5, 1, 2, 3.5]),
+                        }
+                    )
+            task = rng.choice(cls.tasks)
+            values.append(
+                {
+                    "name": "Benchmark running work",
+                    "employee_id": employee.id,
+                    "project_id": task.project_id.id,
+                    "task_id": task.id,
+                    "date_time": datetime.now() - timedelta(hours=1),
+                    "unit_amount": 0,
+                }
+            )
+        cls.env["account.analytic.line"].create(values)
+
+    def _run_cold(self, name, query_count, operation):
+        """Run ``operation`` on empty record caches in ``query_count`` queries."""
+        self.env.invalidate_all()
+        started = time.perf_counter()
+        with self.assertQueryCount(query_count):
+            operation()
+        _logger.info("%s: %.3fs", name, time.perf_counter() - started)
+
+    def _create_switch_wizard(self, task):
+        return (
+            self.env["hr.timesheet.switch"]
+            .with_context(
+                active_model="project.task", active_id=task.id, active_ids=task.ids
+            )
+            .create(
+                {
+                    "name": "Benchmark switch",
+                    "project_id": task.project_id.id,
+                    "task_id": task.id,
+                    "date_time": datetime.now(),
+                }
+            )
+        )
+
+    def test_benchmark_show_time_control(self):
+        for records, query_count in ((self.tasks, 8), (self.projects, 8)):
+            records.mapped("show_time_control")
+            self._run_cold(
+                f"{records._name} show_time_control",
+                query_count,
+                lambda records=records: records.mapped("show_time_control"),
+            )
+            self.assertIn("stop", records.mapped("show_time_control"))
+
+    def test_benchmark_default_get(self):
+        wizard_model = self.env["hr.timesheet.switch"].with_context(
+            active_model="project.task", active_id=self.tasks[0].id
+        )
+        fields_list = list(wizard_model._fields)
+        wizard_model.default_get(fields_list)
+        self._run_cold("default_get", 8, lambda: wizard_model.default_get(fields_list))
+        self.assertTrue(wizard_model.default_get(fields_list)["running_timer_id"])
+
+    def test_benchmark_action_switch(self):
+        self._create_switch_wizard(self.tasks[0]).action_switch()
+        wizard = self._create_switch_wizard(self.tasks[1])
+        running = wizard.running_timer_id
+        self.assertTrue(running)
+        self._run_cold("action_switch", 60, wizard.action_switch)
+        self.assertTrue(running.unit_amount)
+
+    def test_benchmark_button_end_work(self):
+        line_model = self.env["account.analytic.line"]
+        running = line_model.search(line_model._running_domain())
+        self.assertEqual(len(running), 1)
+        # Done beforehand on the timer of another employee
+        line_model.search(
+            [
+                ("employee_id", "=", self.employees[1].id),
+                ("date_time", "!=", False),
+                ("unit_amount", "=", 0),
+            ]
+        ).button_end_work()
+        self._run_cold("button_end_work", 25, running.button_end_work)
+        self.assertTrue(running.unit_amount)
@@ -1,6 +1,8 @@
 # Copyright 2019 Tecnativa - Jairo Llopis
 # License AGPL-3.0 or later (https://www.gnu.org/licenses/agpl).
 
+from collections import defaultdict
+
 from odoo import _, api, fields, models
 from odoo.exceptions import UserError
 from odoo.osv import expression
@@ -97,14 +99,9 @@ class HrTimesheetSwitch(models.TransientModel):
         """Obtain running timer."""
         employee = employee or self.env.user.employee_ids
         # Find running work
-        running = self.env["account.analytic.line"].search(
-            [
-                ("date_time", "!=", False),
-                ("employee_id", "in", employee.ids),
-                ("id", "not in", self.env.context.get("resuming_lines", [])),
-                ("project_id", "!=", False),
-                ("unit_amount", "=", 0),
-            ]
+        running = self.env["hr.timesheet.running.timer"]._get_running_lines(employee)
+        running = running.filtered(
+            lambda line: line.id not in self.env.context.get("resuming_lines", [])
         )
         if len(running) > 1:
             raise UserError(
@@ -144,8 +141,11 @@ class HrTimesheetSwitch(models.TransientModel):
             ]
         else:
             return self.env[model]
-        return self.env["account.analytic.line"].search(
+        # Served by the (employee, task or project, date_time) indexes, and
+        # fetching the suggested values at the same time
+        return self.env["account.analytic.line"].search_fetch(
             domain,
+            ["name", "project_id", "task_id"],
             order="date_time DESC",
             limit=1,
         )
@@ -181,6 +181,12 @@ class HrTimesheetSwitch(models.TransientModel):
     def action_switch(self):
         """Stop old timer, start new one."""
         self.ensure_one()
+        self.env["hr.timesheet.running.timer"]._lock_employees(
+            self.env.user.employee_ids.ids
+        )
+        # The running timer may have changed since the wizard was opened, for
+        # instance from another browser tab
+        self.running_timer_id = self._default_running_timer_id()
         # Stop old timer
         self.with_context(
             resuming_lines=self.ids,
@@ -190,10 +196,10 @@ class HrTimesheetSwitch(models.TransientModel):
         if self.analytic_line_id:
             new = self.analytic_line_id.copy(self._prepare_copy_values(self))
         else:
-            fields = self.env["account.analytic.line"]._fields.keys()
-            vals = self.env["account.analytic.line"].default_get(fields)
-            vals.update(self._prepare_copy_values(self))
-            new = self.env["account.analytic.line"].create(vals)
+            # create() fills in the defaults of the fields not given
+            new = self.env["account.analytic.line"].create(
+                self._prepare_copy_values(self)
+            )
         # Display created timer record if requested
         if self.env.context.get("show_created_timer"):
             form_view = self.env.ref("hr_timesheet.hr_timesheet_line_form")
@@ -205,3 +211,54 @@ class HrTimesheetSwitch(models.TransientModel):
                 "view_type": "form",
                 "views": [(form_view.id, "form")],
             }
+
+    @api.model
+    def switch_employee_timers(self, vals_list):
+        """Stop the running timers of many employees and start new ones.
+
+        :param vals_list: list of dicts with the ``employee_id`` and the values of
+            its new timesheet line, such as ``name``, ``project_id`` and
+            ``task_id``. Their ``date_time``, now by default, is also the moment
+            the running timers of the employee are stopped.
+        :return: list of dicts with the ``employee_id``, the ``stopped_line_ids``
+            and the ``started_line_id`` of each employee.
+        """
+        employee_ids = [vals.get("employee_id") for vals in vals_list]
+        if not all(employee_ids):
+            raise UserError(_("An employee is required for each timer to start."))
+        if len(set(employee_ids)) != len(employee_ids):
+            raise UserError(_("Only one timer can be started per employee."))
+        line_model = self.env["account.analytic.line"]
+        now = fields.Datetime.now()
+        vals_list = [
+            dict(
+                vals,
+                date_time=fields.Datetime.to_datetime(vals.get("date_time") or now),
+                unit_amount=0,
+            )
+            for vals in vals_list
+        ]
+        employees = self.env["hr.employee"].browse(employee_ids)
+        timer_model = self.env["hr.timesheet.running.timer"]
+        timer_model._lock_employees(employees.ids)
+        running = timer_model._get_running_lines(employees)
+        line_ids_per_employee = defaultdict(list)
+        for line in running:
+            line_ids_per_employee[line.employee_id.id].append(line.id)
+        # Stop the running timers, together for the employees switching together
+        line_ids_per_end = defaultdict(list)
+        for vals in vals_list:
+            line_ids_per_end[vals["date_time"]] += line_ids_per_employee[
+                vals["employee_id"]
+            ]
+        for end, line_ids in line_ids_per_end.items():
+            line_model.browse(line_ids)._stop_timers(end)
+        new_lines = line_model.create(vals_list)
+        return [
+            {
+                "employee_id": vals["employee_id"],
+                "stopped_line_ids": line_ids_per_employee[vals["employee_id"]],
+                "started_line_id": new_line.id,
+            }
+            for vals, new_line in zip(vals_list, new_lines, strict=True)
+        ]